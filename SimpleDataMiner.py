@@ -21,6 +21,18 @@ and, if they want, count and sum their columns, into an extract that they can do
         [-u username|--username=username]
         [-p password|--password=password]
         [-d databaseName|--databaseName=databaseName]
+        [-X maxExtracts|--maxExtracts=maxExtracts]
+        [-U maxUserExtracts|--maxUserExtracts=maxUserExtracts]
+        [-Q maxQueued|--maxQueued=maxQueued]
+        [-W maxWait|--maxWait=maxWait]
+        [-R reloadInterval|--reloadInterval=reloadInterval]
+        [-S statsInterval|--statsInterval=statsInterval]
+        [-G aggregateAge|--aggregateAge=aggregateAge]
+        [-K lookupAge|--lookupAge=lookupAge]
+        [-B batchFile|--batchFile=batchFile]
+        [-o outputDir|--outputDir=outputDir]
+        [-j jobs|--jobs=jobs]
+        [-P profileKey|--profileKey=profileKey]
         [-v loggingLevel|--verbose=logingLevel]
         [-L logDir|--logDir=logDir]
         [-l logfile|--logfile=logfile]
@@ -60,14 +72,67 @@ and, if they want, count and sum their columns, into an extract that they can do
     -d databaseName|--databaseName=databaseName]
     The name of the database
 
+    -X maxExtracts|--maxExtracts=maxExtracts
+    The maximum number of extracts that can run at the one time (default=0 - no limit).
+    A per table limit can be set in the optional "maxExtracts" column of the "tables" worksheet
+
+    -U maxUserExtracts|--maxUserExtracts=maxUserExtracts
+    The maximum number of extracts that one user can run at the one time (default=0 - no limit)
+
+    -Q maxQueued|--maxQueued=maxQueued
+    The maximum number of extracts that can be waiting to run (default=20)
+
+    -W maxWait|--maxWait=maxWait
+    The maximum number of seconds that an extract can wait to run (default=60).
+    While an extract is waiting the user is shown its place in the queue
+
+    -R reloadInterval|--reloadInterval=reloadInterval
+    How often, in seconds, to check the Excel workbook for changes (default=30).
+    A changed workbook is checked against the database and, if valid, replaces the current configuration.
+    Set to 0 to never reload the Excel workbook
+
+    -S statsInterval|--statsInterval=statsInterval
+    How often, in seconds, to refresh the column statistics (default=0 - never collected).
+    Each refresh reads every configured column of every table.
+    The column statistics are used to show the range of values in each column
+    and the estimated number of records that the constraints will match,
+    and to reject extracts that must access too many records before they are counted
+
+    -G aggregateAge|--aggregateAge=aggregateAge
+    How long, in seconds, the counts and sums of counted/summed extracts are kept (default=0 - not kept).
+    Kept counts and sums are re-summed to answer later extracts with the same, or a subset of the same, constraints
+    without running them against the database, so they won't include changes made to the database in the meantime
+
+    -K lookupAge|--lookupAge=lookupAge
+    How long, in seconds, the codes and descriptions read from a lookup table are kept (default=3600).
+    They are then read again, so new codes are offered without waiting for the Excel workbook to change.
+    Set to 0 to read them every time they are needed
+
+    -B batchFile|--batchFile=batchFile
+    Run the query specs in this JSON file, rather than running the web site.
+    The file is a list of query specs, each a dictionary of
+    "name", "table", "columns", "constraints", "alternatives", "count", "sum", "orderBy", "top", "decode" and "format" (xlsx or csv).
+    Extracts estimated to be too big for an Excel workbook (the table's "maxBytes") are written as CSV
+
+    -o outputDir|--outputDir=outputDir
+    The directory where the batch extracts will be written (default=".")
+
+    -j jobs|--jobs=jobs
+    The number of batch query specs that can use the database at the one time (default=4)
+
+    -P profileKey|--profileKey=profileKey
+    Enable on demand profiling. Requests with an "X-Profile: profileKey" header,
+    or a "profile=profileKey" query parameter, are profiled and the profile written
+    to the "profiles" directory in the logDir directory
+
     -v loggingLevel|--verbose=loggingLevel
     Set the level of logging that you want.
 
-    -O logDir|--logDir=logDir
+    -L logDir|--logDir=logDir
     The directory where the log file will be created
     (default=".").
 
-    -o logfile|--logfile=logfile
+    -l logfile|--logfile=logfile
     The name of a log file where you want all messages captured.
 
 
@@ -86,20 +151,83 @@ import argparse
 import logging
 import collections
 import json
+import math
 import ast
+import re
+import hmac
+import hashlib
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import dateutil.parser
 import dateutil.tz
 import pandas as pd
-from sqlalchemy import MetaData, create_engine, text
+from sqlalchemy import MetaData, Table, create_engine, text, types, inspect
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import OperationalError, NoSuchTableError
 from sqlalchemy_utils import database_exists
-from flask import Flask, url_for, request, send_file, Response
+from flask import Flask, url_for, request, send_file, Response, g, has_request_context
 from openpyxl import load_workbook
 import data as d
+from admission import ExtractLimiter
+from singleflight import SingleFlight
+from snapshot import ConfigSnapshot
+from columnstats import ColumnStats, WhereEstimator
+from aggcache import AggregateCache, AggregateQuery
+from profiler import StackSampler
 
 
 app = Flask(__name__)
+queryFlights = SingleFlight()      # The queries currently running against the database
+
+def startProfile():
+    '''
+    Start profiling this request, if it asked to be profiled (X-Profile header or profile query parameter) with the profiling key
+    '''
+    profileKey = request.headers.get('X-Profile', request.args.get('profile'))
+    if (profileKey is None) or not hmac.compare_digest(profileKey.encode('utf-8'), d.profileKey.encode('utf-8')):
+        return
+    if request.view_args and ('SQL' in request.view_args):
+        queryText = request.view_args['SQL']
+    else:
+        queryText = request.form.get('where', '') + request.form.get('orWhere', '')
+    thisTable = request.form.get('table', request.args.get('table', ''))
+    queryId = hashlib.sha1(f'{thisTable}:{queryText}'.encode('utf-8')).hexdigest()[:12]
+    g.profileFile = os.path.join(d.profileDir, f'{datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")}-{request.endpoint}-{queryId}.collapsed')
+    g.profiler = StackSampler(0.005)
+    g.profiler.start()
+
+
+def stopProfile(response):
+    '''
+    Stop profiling this request once the response has been sent, so that streamed responses are included
+    File responses (send_file) are passed straight through to the server, without any close callbacks,
+    but they have already been built, so they can stop profiling straight away
+    '''
+    if 'profiler' in g:
+        profiler = g.profiler
+        profileFile = g.profileFile
+        if response.direct_passthrough:
+            profiler.stop(profileFile)
+        else:
+            response.call_on_close(lambda: profiler.stop(profileFile))
+        logging.info('Profiling %s to %s', request.path, profileFile)
+    return response
+
+
+def currentConfig():
+    '''
+    The configuration snapshot for this request, read once when the request first needs it,
+    so that a reload part way through the request can't give it a mix of two configurations
+    Outside of a request (batch extracts and column statistics) the current configuration snapshot
+    '''
+    if has_request_context():
+        if 'config' not in g:
+            g.config = d.config
+        return g.config
+    return d.config
+
 
 def convertInWeb(thisValue):
     '''
@@ -116,50 +244,118 @@ def convertInWeb(thisValue):
     return newValue
 
 
+def readSQL(selectText):
+    '''
+    Run an SQL query and return the result as a pandas DataFrame
+    If an identical query is already running then wait for, and share, its result.
+    Shared results must not be changed in place.
+    '''
+    thisKey = ' '.join(selectText.split())
+    flight, isLeader = queryFlights.join(thisKey)
+    if not isLeader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+    try:
+        result = runSQL(selectText)
+    except Exception as thisE:
+        queryFlights.finish(thisKey, flight, None, thisE)
+        raise
+    except BaseException:           # Interrupted (e.g. shutting down) - the waiting queries must not wait forever
+        queryFlights.finish(thisKey, flight, None, RuntimeError('The identical query that this query was waiting for was abandoned'))
+        raise
+    queryFlights.finish(thisKey, flight, result, None)
+    return result
+
+
+def runSQL(selectText):
+    '''
+    Run an SQL query against the database and return the result as a pandas DataFrame
+    '''
+    with d.engine.connect() as conn:
+        return pd.read_sql_query(text(selectText), conn)
+
+
 @app.route('/', methods=['GET'])
 def splash():
     '''
     Display the Welcome splash page
     '''
+    pageCache = currentConfig().pageCache
+    return cachedResponse(pageCache.page(('splash',), buildSplash))
+
 
+def buildSplash():
+    '''
+    Build the Welcome splash page
+    '''
     message = '<html><head><title>Simple Data Miner</title><link rel="icon" href="data:,"></head><body style="font-size:120%">'
     message += '<h1 style="text-align:center">Welcolme to the Simple Data Miner</h1>'
     message += '<h2 style="text-align:center">Please select the data table you wish to mine</h2>'
-    message += f'<form id="tables" action ="{url_for("doSelectColumns")}" method="post" enctype="multipart/form-data" style="font-size:120%">'
+    message += f'<form id="tables" action ="{url_for("doSelectColumns")}" method="get" style="font-size:120%">'
     message += '<select name="table" style="font-size:120%">'
-    for mineTable, tableConfig in  d.mineTables.items():
+    for mineTable, tableConfig in  currentConfig().mineTables.items():
         message += f'<option value="{mineTable}">{tableConfig["tableName"]}'
     message += '</select><br/><br/>'
     message += '<input id="submit" type="submit" name="submit" value="Please mine this table" style="font-size:120%">'
     message += '</form>'
     message += '</body></html>'
-    return Response(response=message, status=200)
+    return message
 
 
-@app.route('/doSelectColumns', methods=['POST'])
+@app.route('/doSelectColumns', methods=['GET', 'POST'])
 def doSelectColumns():
     '''
     For the selected table, list the columns and ask the user to select which ones are to be included in the extract
     '''
-    message = '<html><head><title>Simple Data Miner</title><link rel="icon" href="data:,"></head><body style="font-size:120%">'
-    message += '<h1 style="text-align:center">Simple Data Miner</h1>'
+    pageCache = currentConfig().pageCache
     thisMessage, thisTable, dummy1, dummy2, dummy3, dummy4 = checkForm(request, 1)
     if thisMessage is not None:
+        message = '<html><head><title>Simple Data Miner</title><link rel="icon" href="data:,"></head><body style="font-size:120%">'
+        message += '<h1 style="text-align:center">Simple Data Miner</h1>'
         message += thisMessage
         return Response(response=message, status=400)
-    message += f'<h2 style="text-align:center">For the "{d.mineTables[thisTable]["tableName"]}" table</h2>'
+    return cachedResponse(pageCache.page(('doSelectColumns', thisTable), lambda: buildSelectColumns(thisTable)))
+
+
+def buildSelectColumns(thisTable):
+    '''
+    Build the "select columns" web page for this table
+    '''
+    message = '<html><head><title>Simple Data Miner</title><link rel="icon" href="data:,"></head><body style="font-size:120%">'
+    message += '<h1 style="text-align:center">Simple Data Miner</h1>'
+    message += f'<h2 style="text-align:center">For the "{currentConfig().mineTables[thisTable]["tableName"]}" table</h2>'
     message += '<h3 style="text-align:center">Please select the columns you would like mined into your extract</h3>'
     message += f'<form id="selected" action ="{url_for("constrainColumns")}" method="post" enctype="multipart/form-data">'
     message += f'<input id="table" type="hidden" name="table" value="{thisTable}">'
     message += '<table>'
-    for i, thisCol in enumerate(d.mineTables[thisTable]['columns']):
+    for i, thisCol in enumerate(currentConfig().mineTables[thisTable]['columns']):
         message += f'<tr><td><input type="checkbox" name="selected" value="{i}"></td><td style="font-size:150%">{thisCol["columnName"]}</td></tr>'
     message += '</table>'
     message += '<br/>'
-    message += f'<input id="submit" type="submit" name="submit" value="Please mine these columns in the {d.mineTables[thisTable]["tableName"]} table" style="font-size:120%">'
+    message += f'<input id="submit" type="submit" name="submit" value="Please mine these columns in the {currentConfig().mineTables[thisTable]["tableName"]} table" style="font-size:120%">'
     message += '</form>'
     message += '</body></html>'
-    return Response(response=message, status=200)
+    return message
+
+
+def cachedResponse(page):
+    '''
+    Return a precomputed page - gzip compressed if the browser accepts gzip,
+    or "304 Not Modified" if the browser already has this version of the page
+    '''
+    if 'gzip' in request.accept_encodings:
+        response = Response(response=page.gzipBody, status=200)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(page.etag + '-gzip')
+    else:
+        response = Response(response=page.body, status=200)
+        response.set_etag(page.etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'        # Always check, as the configuration can change
+    response.last_modified = page.lastModified
+    return response.make_conditional(request)
 
 
 @app.route('/constrainColumns', methods=['POST'])
@@ -180,85 +376,181 @@ def constrainColumns():
         message += '</form>'
         message += '</body></html>'
         return Response(response=message, status=400)
-    message += f'<h2 style="text-align:center">For the "{d.mineTables[thisTable]["tableName"]}" table</h2>'
-    message += '<h3 style="text-align:center">Please select any columns that you would like constrained in you mined extract</h3>'
+    columnsSelected = []
+    for selected in request.form.getlist('selected'):
+        columnsSelected.append(convertInWeb(selected.strip()))
+    message += buildConstrainColumns(thisTable, columnsSelected, '')
+    return Response(response=message, status=200)
+
+
+def buildConstrainColumns(thisTable, columnsSelected, orWhere):
+    '''
+    Build the "select columns to constrain" web page
+    '''
+    message = f'<h2 style="text-align:center">For the "{currentConfig().mineTables[thisTable]["tableName"]}" table</h2>'
+    if orWhere == '':
+        message += '<h3 style="text-align:center">Please select any columns that you would like constrained in you mined extract</h3>'
+    else:
+        message += '<h3 style="text-align:center">Please select any columns that you would like constrained in this alternative set of constraints</h3>'
     message += f'<form id="selected" action ="{url_for("doNextConstraint")}" method="post" enctype="multipart/form-data">'
     message += f'<input id="table" type="hidden" name="table" value="{thisTable}">'
     message += '<input id="first" type="hidden" name="first" value="1">'
+    message += f"<input id='orWhere' type='hidden' name='orWhere' value='{orWhere}'>"
     message += '<table>'
-    columnsSelected = []
-    for i, selected in enumerate(request.form.getlist('selected')):
-        columnsSelected.append(convertInWeb(selected.strip()))
+    for i, selected in enumerate(columnsSelected):
         message += f'<tr><td><input type="checkbox" name="selected" value="{i}"></td>'
-        message += f'<td style="font-size:150%">{d.mineTables[thisTable]["columns"][int(selected)]["columnName"]}</td></tr>'
+        message += f'<td style="font-size:150%">{currentConfig().mineTables[thisTable]["columns"][int(selected)]["columnName"]}</td></tr>'
     message += '</table>'
     message += '<br/>'
     message += f'<input id="columnsSelected" type="hidden" name="columnsSelected" value="{columnsSelected}">'
-    message += f'<input id="submit" type="submit" name="submit" value="Please constrain these columns when mining the {d.mineTables[thisTable]["tableName"]} table" style="font-size:120%">'
+    message += f'<input id="submit" type="submit" name="submit" value="Please constrain these columns when mining the {currentConfig().mineTables[thisTable]["tableName"]} table" style="font-size:120%">'
     message += '</form>'
     message += '</body></html>'
+    return message
+
+
+@app.route('/doOrGroup', methods=['POST'])
+def doOrGroup():
+    '''
+    Save the constraints so far as one alternative set of constraints and let the user constrain the next alternative
+    '''
+    message = '<html><head><title>Simple Data Miner</title><link rel="icon" href="data:,"></head><body style="font-size:120%">'
+    message += '<h1 style="text-align:center">Simple Data Miner</h1>'
+    thisMessage, thisTable, columnsSelected, dummy1, dummy2, where = checkForm(request, 3)
+    if thisMessage is not None:
+        message += thisMessage
+        return Response(response=message, status=400)
+    message += buildConstrainColumns(thisTable, columnsSelected, combineWhere(request.form.get('orWhere', '').strip(), where))
     return Response(response=message, status=200)
 
 
+def combineWhere(orWhere, where):
+    '''
+    OR this set of constraints with the alternative sets of constraints
+    '''
+    if (where is None) or (where == ''):
+        return orWhere
+    if orWhere == '':
+        return f'({where})'
+    return f'{orWhere} OR ({where})'
+
+
+def getLookupCodes(thisCol):
+    '''
+    Return the code/description dictionary for the lookup table associated with this column
+    '''
+    return readLookupCodes(thisCol)[1]
+
+
+def readLookupCodes(thisCol):
+    '''
+    Return when the code/description dictionary for the lookup table associated with this column was read, and the dictionary
+    The dictionary is cached, and read again from the database once it is more than lookupAge seconds old
+    '''
+    lookupKey = (thisCol['lookupTable'], thisCol['lookupCodeColumn'], thisCol['lookupDescriptionColumn'])
+    lookupCodes = currentConfig().lookupCodes
+    thisCodes = lookupCodes.get(lookupKey)
+    if (thisCodes is None) or (time.monotonic() - thisCodes[0] >= d.lookupAge):
+        readTime = time.monotonic()
+        selectText = f'SELECT {thisCol["lookupCodeColumn"]}, {thisCol["lookupDescriptionColumn"]} FROM {thisCol["lookupTable"]}'
+        codes_df = readSQL(selectText)
+        thisCodes = (readTime, dict(codes_df.values.tolist()))      # Convert to a dictionary of {code:description}
+        lookupCodes[lookupKey] = thisCodes
+    return thisCodes
+
+
+def statsSummary(thisTable, thisCol):
+    '''
+    Describe the values in this column, from the column statistics
+    '''
+    tableStats = d.columnStats.get(thisTable)
+    if (tableStats is None) or (thisCol['column'] not in tableStats['columns']):
+        return ''
+    thisStats = tableStats['columns'][thisCol['column']]
+    if thisStats.minValue is None:
+        return f'<p style="text-align:center">The "{thisCol["columnName"]}" column is empty in every record</p>'
+    message = f'<p style="text-align:center">Values in the "{thisCol["columnName"]}" column range from {thisStats.minValue} to {thisStats.maxValue}'
+    message += f', with about {thisStats.distinct:,} different values, and are empty in {thisStats.nullFraction:.0%} of records</p>'
+    return message
+
+
 def makeConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where):
     '''
     Build the web form for selecting a constraint
     '''
+    pageCache = currentConfig().pageCache
     thisColumn = columnsSelected[int(constrainedColumns[nextConstraint])]
-    thisCol = d.mineTables[thisTable]['columns'][thisColumn]
+    thisCol = currentConfig().mineTables[thisTable]['columns'][thisColumn]
     thisColumnName = thisCol['columnName']
     thisDatatype = thisCol['datatype']
     thisColumnLookup = thisCol['lookupTable']
-    thisColumnLookupCode = thisCol['lookupCodeColumn']
-    thisColumnLookupDesc = thisCol['lookupDescriptionColumn']
-    message = f'<h2 style="text-align:center">For the column "{thisColumnName}" in the "{d.mineTables[thisTable]["tableName"]}" table</h2>'
+    message = f'<h2 style="text-align:center">For the column "{thisColumnName}" in the "{currentConfig().mineTables[thisTable]["tableName"]}" table</h2>'
     if (thisDatatype != "string") or (thisColumnLookup is None):
         message += f'<h3 style="text-align:center">Please select the type of constraint(s) on the data from the "{thisColumnName}" column to restrict the data in your mined extract</h3>'
     else:
         message += f'<h3 style="text-align:center">Please select codes from the "{thisColumnName}" column that you would like included in your mined extract</h3>'
+    message += statsSummary(thisTable, thisCol)
     message += f'<form id="selected" action ="{url_for("doThisConstraint")}" method="post" enctype="multipart/form-data">'
     message += f'<input id="table" type="hidden" name="table" value="{thisTable}">'
     message += f'<input id="columnsSelected" type="hidden" name="columnsSelected" value="{columnsSelected}">'
     message += f'<input id="constrainedColumn" type="hidden" name="constrainedColumns" value="{constrainedColumns}">'
     message += f'<input id="nextConstraint" type="hidden" name="nextConstraint" value="{nextConstraint}">'
-    message += f"<input id='where' type='hidden' name='where' value='{where}'>"
+    message += whereFields(where)
     message += '<table>'
-    if (thisDatatype != "string") or (thisColumnLookup is None):
-        message += '<tr><td><input id="equals" type="checkbox" name="constraint" value="equals"></td><td style="font-size:150%">Equals a specific value</td></tr>'
-        message += '<tr><td><input id="notEquals" type="checkbox" name="constraint" value="notEquals"></td><td style="font-size:150%">Does not equal a specific value</td></tr>'
-        if thisDatatype != 'string':
-            message += '<tr><td><input id="gtThan" type="checkbox" name="constraint" value="gtThan"></td><td style="font-size:150%">Greater than a specific value</td></tr>'
-            message += '<tr><td><input id="gteThan" type="checkbox" name="constraint" value="gteThan"></td><td style="font-size:150%">Greater than or equal to a specific value</td></tr>'
-            message += '<tr><td><input id="ltThan" type="checkbox" name="constraint" value="ltThan"></td><td style="font-size:150%">Less than a specif value</td></tr>'
-            message += '<tr><td><input id="lteThan" type="checkbox" name="constraint" value="lteThan"></td><td style="font-size:150%">Less than or equal to a specif value</td></tr>'
-            message += '<tr><td><input id="inRange" type="checkbox" name="constraint" value="inRange"></td><td style="font-size:150%">Within a range of values</td></tr>'
+    optionsKey = ('constraintOptions', thisTable, thisColumn)
+    codesRead = None                # The codes are offered as options, so the options are rebuilt whenever the codes are read again
+    if (thisDatatype == "string") and (thisColumnLookup is not None):
+        codesRead, codes = readLookupCodes(thisCol)
+    options = pageCache.fragment(optionsKey, codesRead)
+    if options is None:
+        if (thisDatatype != "string") or (thisColumnLookup is None):
+            options = '<tr><td><input id="equals" type="checkbox" name="constraint" value="equals"></td><td style="font-size:150%">Equals a specific value</td></tr>'
+            options += '<tr><td><input id="notEquals" type="checkbox" name="constraint" value="notEquals"></td><td style="font-size:150%">Does not equal a specific value</td></tr>'
+            if thisDatatype != 'string':
+                options += '<tr><td><input id="gtThan" type="checkbox" name="constraint" value="gtThan"></td><td style="font-size:150%">Greater than a specific value</td></tr>'
+                options += '<tr><td><input id="gteThan" type="checkbox" name="constraint" value="gteThan"></td><td style="font-size:150%">Greater than or equal to a specific value</td></tr>'
+                options += '<tr><td><input id="ltThan" type="checkbox" name="constraint" value="ltThan"></td><td style="font-size:150%">Less than a specif value</td></tr>'
+                options += '<tr><td><input id="lteThan" type="checkbox" name="constraint" value="lteThan"></td><td style="font-size:150%">Less than or equal to a specif value</td></tr>'
+                options += '<tr><td><input id="inRange" type="checkbox" name="constraint" value="inRange"></td><td style="font-size:150%">Within a range of values</td></tr>'
+                options += '<tr><td><input id="notInRange" type="checkbox" name="constraint" value="notInRange"></td><td style="font-size:150%">Outside a range of values</td></tr>'
+            else:
+                options += '<tr><td><input id="starts" type="checkbox" name="constraint" value="starts"></td><td style="font-size:150%">Starts with specific string of characters</td></tr>'
+                options += '<tr><td><input id="ends" type="checkbox" name="constraint" value="ends"></td><td style="font-size:150%">Ends with specific string of characters</td></tr>'
+                options += '<tr><td><input id="contains" type="checkbox" name="constraint" value="contains"></td><td style="font-size:150%">Contains a specific string of characters</td></tr>'
+                options += '<tr><td><input id="notContains" type="checkbox" name="constraint" value="notContains"></td><td style="font-size:150%">Does not contains a specific string of characters</td></tr>'
+            options += '<tr><td><input id="inList" type="checkbox" name="constraint" value="inList"></td><td style="font-size:150%">In a list of values</td></tr>'
         else:
-            message += '<tr><td><input id="starts" type="checkbox" name="constraint" value="starts"></td><td style="font-size:150%">Starts with specific string of characters</td></tr>'
-            message += '<tr><td><input id="ends" type="checkbox" name="constraint" value="ends"></td><td style="font-size:150%">Ends with specific string of characters</td></tr>'
-            message += '<tr><td><input id="contains" type="checkbox" name="constraint" value="contains"></td><td style="font-size:150%">Contains a specific string of characters</td></tr>'
-            message += '<tr><td><input id="notContains" type="checkbox" name="constraint" value="notContains"></td><td style="font-size:150%">Does not contains a specific string of characters</td></tr>'
-    else:
-        selectText = f'SELECT {thisColumnLookupCode}, {thisColumnLookupDesc} FROM {thisColumnLookup}'
-        codes_df = pd.read_sql_query(text(selectText), d.engine.connect())
-        codes = codes_df.values.tolist()            # Convert to a list of lists (will be [[code, description]])
-        for codeRow in codes:
-            message += f'<tr><td><input type="checkbox" name="selectCode" value="{codeRow[0]}"></td><td style="font-size:150%">{codeRow[0]}</td><td style="font-size:150%">{codeRow[1]}</td></tr>'
+            options = ''
+            for code, description in codes.items():
+                options += f'<tr><td><input type="checkbox" name="selectCode" value="{code}"></td><td style="font-size:150%">{code}</td><td style="font-size:150%">{description}</td></tr>'
+        options = pageCache.setFragment(optionsKey, options, codesRead)
+    message += options
     message += '</table>'
     message += '<br/>'
     if (thisDatatype != "string") or (thisColumnLookup is None):
-        message += f'<input id="submit" type="submit" name="submit" value="Please apply this/these constrains to the \'{thisColumnName}\' column when mining the \'{d.mineTables[thisTable]["tableName"]}\' table" style="font-size:150%">'
+        message += f'<input id="submit" type="submit" name="submit" value="Please apply this/these constrains to the \'{thisColumnName}\' column when mining the \'{currentConfig().mineTables[thisTable]["tableName"]}\' table" style="font-size:150%">'
     else:
-        message += f'<input id="submit" type="submit" name="submit" value="Please only include these values from the \'{thisColumnName}\' column when mining the \'{d.mineTables[thisTable]["tableName"]}\' table" style="font-size:150%">'
+        message += f'<input id="submit" type="submit" name="submit" value="Please only include these values from the \'{thisColumnName}\' column when mining the \'{currentConfig().mineTables[thisTable]["tableName"]}\' table" style="font-size:150%">'
     message += '</form>'
     message += '</body></html>'
     return message
 
 
+def whereFields(where):
+    '''
+    Build the hidden form fields that carry 'where', and any alternative (OR'ed) sets of constraints, on to the next page
+    '''
+    orWhere = request.form.get('orWhere', '')
+    message = f"<input id='where' type='hidden' name='where' value='{where}'>"
+    message += f"<input id='orWhere' type='hidden' name='orWhere' value='{orWhere}'>"
+    return message
+
+
 def checkForm(thisRequest, level):
     '''
     Check that the form data hasn't go lost
     '''
-    if ('table' not in thisRequest.form) or ((thisTable := convertInWeb(thisRequest.form['table'].strip())) not in d.mineTables):
+    if ('table' not in thisRequest.values) or ((thisTable := convertInWeb(thisRequest.values['table'].strip())) not in currentConfig().mineTables):
         message = f'<p style="text-align:centre"><b><a href="{url_for("splash")}">Internal error (lost selected table) - please click here to start again</a></b>'
         message += '</body></html>'
         return message, thisTable, None, None, None, None
@@ -350,7 +642,7 @@ def doThisConstraint():
     if thisMessage is not None:
         message += thisMessage
         return Response(response=message, status=400)
-    thisCol = d.mineTables[thisTable]['columns'][columnsSelected[constrainedColumns[nextConstraint]]]
+    thisCol = currentConfig().mineTables[thisTable]['columns'][columnsSelected[constrainedColumns[nextConstraint]]]
     thisColumn = thisCol['column']
     thisColumnName = thisCol['columnName']
     if ('constraint' not in request.form) and ('selectCode' not in request.form):
@@ -359,7 +651,7 @@ def doThisConstraint():
         message += f'<input id="columnsSelected" type="hidden" name="columnsSelected" value="{columnsSelected}">'
         message += f'<input id="constrainedColumn" type="hidden" name="table" value="{constrainedColumns}">'
         message += f'<input id="nextConstraint" type="hidden" name="table" value="{nextConstraint}">'
-        message += f"<input id='where' type='hidden' name='where' value='{where}'>"
+        message += whereFields(where)
         message += '<input id="submit" type="select" name="select" value="No constraint type selected - click here to try again">'
         message += '</form>'
         message += '</body></html>'
@@ -370,7 +662,7 @@ def doThisConstraint():
         message += f'<form id="setConstraints" action ="{url_for("setConstraints")}" method="post" enctype="multipart/form-data">'
         message += f'<input id="table" type="hidden" name="table" value="{thisTable}">'
         message += f'<input id="columnsSelected" type="hidden" name="columnsSelected" value="{columnsSelected}">'
-        message += f"<input id='where' type='hidden' name='where' value='{where}'>"
+        message += whereFields(where)
         message += '<table>'
         constraintType = []
         for thisConstraintType in request.form.getlist('constraint'):
@@ -378,19 +670,7 @@ def doThisConstraint():
         message += buildConstraintValues(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, constraintType)
         return Response(response=message, status=200)
     else:
-        if where is None:
-            where = ''
-        if where != '':
-            where += ' AND '
-        where += f'{thisColumn} in ('
-        first = True
-        for thisCode in request.form.getlist('selectCode'):
-            if first:
-                first = False
-            else:
-                where += ', '
-            where += f'"{thisCode}"'
-        where += ')'
+        where = setInList(where, thisColumn, request.form.getlist('selectCode'), 'string')
         nextConstraint += 1
         if nextConstraint < len(constrainedColumns):
             message += makeConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where)
@@ -403,58 +683,81 @@ def buildConstraintValues(thisTable, columnsSelected, constrainedColumns, nextCo
     '''
     Build the form for inputting the constraint value(s)
     '''
-    thisCol = d.mineTables[thisTable]['columns'][columnsSelected[constrainedColumns[nextConstraint]]]
+    pageCache = currentConfig().pageCache
+    thisColumn = columnsSelected[constrainedColumns[nextConstraint]]
+    thisCol = currentConfig().mineTables[thisTable]['columns'][thisColumn]
     thisColumnName = thisCol['columnName']
     message = f'<h2 style="text-align:center">For column "{thisColumnName}" in table "{thisTable}"</h2>'
     message += '<h3 style="text-align:center">Enter the value(s) required for this/these constraint(s)</h3>'
+    message += statsSummary(thisTable, thisCol)
     message += f'<form id="setConstraints" action ="{url_for("setConstraints")}" method="post" enctype="multipart/form-data">'
     message += f'<input id="table" type="hidden" name="table" value="{thisTable}">'
     message += f'<input id="columnsSelected" type="hidden" name="columnsSelected" value="{columnsSelected}">'
     message += f'<input id="constrainedColumn" type="hidden" name="constrainedColumns" value="{constrainedColumns}">'
     message += f'<input id="nextConstraint" type="hidden" name="nextConstraint" value="{nextConstraint}">'
-    message += f"<input id='where' type='hidden' name='where' value='{where}'>"
+    message += whereFields(where)
     message += '<table>'
-    for thisConstraint in constraintType:
-        if thisConstraint == 'equals':
-            message += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must equal</td>'
-            message += '<td><input id="input" type="text" name="inputEquals"></td></tr>'
-        elif thisConstraint == 'notEquals':
-            message += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must <b>not</b> equal</td>'
-            message += '<td><input id="input" type="text" name="inputNotEquals"></td></tr>'
-        elif thisConstraint == 'gtThan':
-            message += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must be greater than</td>'
-            message += '<td><input id="input" type="text" name="inputGtThan"></td></tr>'
-        elif thisConstraint == 'gteThan':
-            message += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must be equal or greater than</td>'
-            message += '<td><input id="input" type="text" name="inputGteThan"></td></tr>'
-        elif thisConstraint == 'ltThan':
-            message += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must be less than</td>'
-            message += '<td><input id="input" type="text" name="inputLtThan"></td></tr>'
-        elif thisConstraint == 'lteThan':
-            message += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must be equal or less than</td>'
-            message += '<td><input id="input" type="text" name="inputLteThan"></td></tr>'
-        elif thisConstraint == 'starts':
-            message += f'<tr><td style="font-size:150%">Enter the characters that data from column "{thisColumnName}" must start with</td>'
-            message += '<td><input id="input" type="text" name="inputStarts"></td></tr>'
-        elif thisConstraint == 'ends':
-            message += f'<tr><td style="font-size:150%">Enter the characters that data from "{thisColumnName}" must end with</td>'
-            message += '<td><input id="input" type="text" name="inputEnds"></td></tr>'
-        elif thisConstraint == 'contains':
-            message += '<tr><td style="font-size:150%">Enter the character must be contained in  data from column "{thisColumnName}"</td>'
-            message += '<td><input id="input" type="text" name="inputContains"></td></tr>'
-        elif thisConstraint == 'notContains':
-            message += f'<tr><td style="font-size:150%">Enter the characters must <b>not</b> be contained in data from column "{thisColumnName}"</td>'
-            message += '<td><input id="input" type="text" name="inputNotContains"></td></tr>'
-        elif thisConstraint == 'inRange':
-            message += f'<tr><td style="font-size:150%">Enter the minimum value for data from column "{thisColumnName}"</td>'
-            message += '<td><input id="input" type="text" name="inputInRangeLow"></td></tr>'
-            message += '<td><input id="lowRangeExclude" type="checkbox" name="lowRangeExclude"></td><td>Exclude this value from the mined data</td></tr>'
-            message += f'<tr><td style="font-size:150%">Enter the maxumum value for data from column "{thisColumnName}"</td>'
-            message += '<td><input id="input" type="text" name="inputInRangeHigh"></td></tr>'
-            message += '<td><input id="highRangeExclude" type="checkbox" name="highRangeExclude"></td><td>Exclude this value from the mined data</td></tr>'
-        else:
-            message = f'<p style="text-align:centre"><b><a href="{url_for("splash")}">Internal error (unknown constraint type "{thisConstraint}") - please click here to start again</a></b>'
-            return message
+    inputsKey = ('constraintInputs', thisTable, thisColumn, tuple(constraintType))
+    inputs = pageCache.fragment(inputsKey)
+    if inputs is None:
+        inputs = ''
+        for thisConstraint in constraintType:
+            if thisConstraint == 'equals':
+                inputs += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must equal</td>'
+                inputs += '<td><input id="input" type="text" name="inputEquals"></td></tr>'
+            elif thisConstraint == 'notEquals':
+                inputs += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must <b>not</b> equal</td>'
+                inputs += '<td><input id="input" type="text" name="inputNotEquals"></td></tr>'
+            elif thisConstraint == 'gtThan':
+                inputs += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must be greater than</td>'
+                inputs += '<td><input id="input" type="text" name="inputGtThan"></td></tr>'
+            elif thisConstraint == 'gteThan':
+                inputs += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must be equal or greater than</td>'
+                inputs += '<td><input id="input" type="text" name="inputGteThan"></td></tr>'
+            elif thisConstraint == 'ltThan':
+                inputs += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must be less than</td>'
+                inputs += '<td><input id="input" type="text" name="inputLtThan"></td></tr>'
+            elif thisConstraint == 'lteThan':
+                inputs += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must be equal or less than</td>'
+                inputs += '<td><input id="input" type="text" name="inputLteThan"></td></tr>'
+            elif thisConstraint == 'starts':
+                inputs += f'<tr><td style="font-size:150%">Enter the characters that data from column "{thisColumnName}" must start with</td>'
+                inputs += '<td><input id="input" type="text" name="inputStarts"></td></tr>'
+            elif thisConstraint == 'ends':
+                inputs += f'<tr><td style="font-size:150%">Enter the characters that data from "{thisColumnName}" must end with</td>'
+                inputs += '<td><input id="input" type="text" name="inputEnds"></td></tr>'
+            elif thisConstraint == 'contains':
+                inputs += '<tr><td style="font-size:150%">Enter the character must be contained in  data from column "{thisColumnName}"</td>'
+                inputs += '<td><input id="input" type="text" name="inputContains"></td></tr>'
+            elif thisConstraint == 'notContains':
+                inputs += f'<tr><td style="font-size:150%">Enter the characters must <b>not</b> be contained in data from column "{thisColumnName}"</td>'
+                inputs += '<td><input id="input" type="text" name="inputNotContains"></td></tr>'
+            elif thisConstraint == 'inList':
+                inputs += f'<tr><td style="font-size:150%">Paste the list of values that data from column "{thisColumnName}" must be in (one per line, or separated by commas - a few thousand values at most)</td>'
+                inputs += '<td><textarea id="input" name="inputInList" rows="10" cols="30"></textarea></td></tr>'
+                inputs += '<tr><td style="font-size:150%">Or upload a file containing the list of values</td>'
+                inputs += '<td><input id="input" type="file" name="inputInListFile"></td></tr>'
+            elif thisConstraint == 'inRange':
+                inputs += f'<tr><td style="font-size:150%">Enter the minimum value for data from column "{thisColumnName}"</td>'
+                inputs += '<td><input id="input" type="text" name="inputInRangeLow"></td></tr>'
+                inputs += '<td><input id="lowRangeExclude" type="checkbox" name="lowRangeExclude"></td><td>Exclude this value from the mined data</td></tr>'
+                inputs += f'<tr><td style="font-size:150%">Enter the maxumum value for data from column "{thisColumnName}"</td>'
+                inputs += '<td><input id="input" type="text" name="inputInRangeHigh"></td></tr>'
+                inputs += '<td><input id="highRangeExclude" type="checkbox" name="highRangeExclude"></td><td>Exclude this value from the mined data</td></tr>'
+            elif thisConstraint == 'notInRange':
+                inputs += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must be below</td>'
+                inputs += '<td><input id="input" type="text" name="inputNotInRangeLow"></td></tr>'
+                inputs += '<td><input id="lowNotRangeInclude" type="checkbox" name="lowNotRangeInclude"></td><td>Include this value in the mined data</td></tr>'
+                inputs += f'<tr><td style="font-size:150%">Enter the value that data from column "{thisColumnName}" must be above</td>'
+                inputs += '<td><input id="input" type="text" name="inputNotInRangeHigh"></td></tr>'
+                inputs += '<td><input id="highNotRangeInclude" type="checkbox" name="highNotRangeInclude"></td><td>Include this value in the mined data</td></tr>'
+            else:
+                message = f'<p style="text-align:centre"><b><a href="{url_for("splash")}">Internal error (unknown constraint type "{thisConstraint}") - please click here to start again</a></b>'
+                return message
+        if len(constraintType) > 1:
+            inputs += '<tr><td><input id="anyConstraint" type="checkbox" name="anyConstraint"></td><td style="font-size:150%">Include data that matches <b>any</b> (OR), rather than all (AND), of these constraints</td></tr>'
+        inputs = pageCache.setFragment(inputsKey, inputs)
+    message += inputs
     message += '</table>'
     message += '<br/>'
     message += '<input id="submit" name="submit" type="submit" value="Set this/these constraint(s)" style="font-size:150%">'
@@ -470,6 +773,11 @@ def testValue(value, datatype):
     if datatype == 'string':
         return str(value)
     elif datatype in ['int', 'float', 'numeric', 'decimal']:
+        if datatype == 'int':
+            try:
+                return int(str(value))      # Large integers (e.g. IDs) would lose precision as floats
+            except ValueError:
+                pass
         try:
             x = float(value)
         except Exception as thisE:
@@ -489,16 +797,67 @@ def setValue(where, thisColumn, relop, value, datatype):
     '''
     Construct a constraint for this column
     '''
+    if datatype in ['int', 'float', 'numeric', 'decimal']:
+        return addClause(where, f'{thisColumn} {relop} {value}')
+    return addClause(where, f'{thisColumn} {relop} "{value}"')
+
+
+def addClause(where, clause):
+    '''
+    AND a constraint to 'where'
+    '''
     if where is None:
         where = ''
     if where != '':
         where += ' AND '
-    where += f'{thisColumn} {relop} '
+    return where + clause
+
+
+def addClauses(where, clauses, anyClause):
+    '''
+    Add the constraints on one column to 'where'
+    The constraints are AND'ed, unless anyClause, in which case they are OR'ed as one group
+    '''
+    if anyClause and (len(clauses) > 1):
+        orClauses = []
+        for clause in clauses:
+            if ' AND ' in clause:
+                orClauses.append(f'({clause})')
+            else:
+                orClauses.append(clause)
+        return addClause(where, '(' + ' OR '.join(orClauses) + ')')
+    for clause in clauses:
+        where = addClause(where, clause)
+    return where
+
+
+def setInList(where, thisColumn, values, datatype):
+    '''
+    Construct an "in list" constraint for this column
+    Long lists are split into chunks, OR'ed together, as some databases limit the length of an "in" list
+    '''
     if datatype in ['int', 'float', 'numeric', 'decimal']:
-        where += f'{value}'
+        items = [f'{value}' for value in values]
     else:
-        where += f'"{value}"'
-    return where
+        items = [f'"{value}"' for value in values]
+    inLists = []
+    for chunk in range(0, len(items), d.inListChunk):
+        inLists.append(f'{thisColumn} in ({", ".join(items[chunk:chunk + d.inListChunk])})')
+    if len(inLists) == 1:
+        return addClause(where, inLists[0])
+    return addClause(where, '(' + ' OR '.join(inLists) + ')')
+
+
+def splitList(listText):
+    '''
+    Split a pasted or uploaded list of values into the distinct values
+    Values can be one per line or separated by commas or tabs
+    '''
+    values = []
+    for value in re.split(r'[,\t\r\n]+', listText):
+        if value.strip() != '':
+            values.append(value.strip())
+    return list(dict.fromkeys(values))
 
 
 @app.route('/setConstraints', methods=['POST'])
@@ -513,78 +872,93 @@ def setConstraints():
         message += thisMessage
         return Response(response=message, status=400)
     whereWas = where
-    thisCol = d.mineTables[thisTable]['columns'][constrainedColumns[nextConstraint]]
+    thisCol = currentConfig().mineTables[thisTable]['columns'][columnsSelected[constrainedColumns[nextConstraint]]]
     thisColumn = thisCol['column']
     thisColumnName = thisCol['columnName']
     thisDatatype = thisCol['datatype']
+    clauses = []            # The constraint(s) on this column
     if 'inputEquals' in request.form:
         thisValue = convertInWeb(request.form['inputEquals'].strip())
         if (value := testValue(thisValue, thisDatatype)) is None:
             message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
             return Response(response=message, status=200)
-        where = setValue(where, thisColumn, '=', value, thisDatatype)
+        clauses.append(setValue('', thisColumn, '=', value, thisDatatype))
     if 'inputNotEquals' in request.form:
         thisValue = convertInWeb(request.form['inputNotEquals'].strip())
         if (value := testValue(thisValue, thisDatatype)) is None:
             message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
             return Response(response=message, status=200)
-        where = setValue(where, thisColumn, '!=', value, thisDatatype)
+        clauses.append(setValue('', thisColumn, '!=', value, thisDatatype))
     if 'inputGtThan' in request.form:
         thisValue = convertInWeb(request.form['inputGtThan'].strip())
         if (value := testValue(thisValue, thisDatatype)) is None:
             message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
             return Response(response=message, status=200)
-        where = setValue(where, thisColumn, '>', value, thisDatatype)
+        clauses.append(setValue('', thisColumn, '>', value, thisDatatype))
     if 'inputGteThan' in request.form:
         thisValue = convertInWeb(request.form['inputGteThan'].strip())
         if (value := testValue(thisValue, thisDatatype)) is None:
             message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
             return Response(response=message, status=200)
-        where = setValue(where, thisColumn, '>=', value, thisDatatype)
+        clauses.append(setValue('', thisColumn, '>=', value, thisDatatype))
     if 'inputLtThan' in request.form:
         thisValue = convertInWeb(request.form['inputLtThan'].strip())
         if (value := testValue(thisValue, thisDatatype)) is None:
             message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
             return Response(response=message, status=200)
-        where = setValue(where, thisColumn, '<', value, thisDatatype)
+        clauses.append(setValue('', thisColumn, '<', value, thisDatatype))
     if 'inputLteThan' in request.form:
         thisValue = convertInWeb(request.form['inputLteThan'].strip())
         if (value := testValue(thisValue, thisDatatype)) is None:
             message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
             return Response(response=message, status=200)
-        where = setValue(where, thisColumn, '<=', value, thisDatatype)
+        clauses.append(setValue('', thisColumn, '<=', value, thisDatatype))
     if 'inputStarts' in request.form:
         thisValue = convertInWeb(request.form['inputStarts'].strip())
         if (value := testValue(thisValue, thisDatatype)) is None:
             message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
             return Response(response=message, status=200)
-        where = setValue(where, thisColumn, 'like', f'{value}%', thisDatatype)
+        clauses.append(setValue('', thisColumn, 'like', f'{value}%', thisDatatype))
     if 'inputEnds' in request.form:
         thisValue = convertInWeb(request.form['inputEnds'].strip())
         if (value := testValue(thisValue, thisDatatype)) is None:
             message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
             return Response(response=message, status=200)
-        where = setValue(where, thisColumn, 'like', f'%{value}', thisDatatype)
+        clauses.append(setValue('', thisColumn, 'like', f'%{value}', thisDatatype))
     if 'inputContains' in request.form:
         thisValue = convertInWeb(request.form['inputContains'].strip())
         if (value := testValue(thisValue, thisDatatype)) is None:
             message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
             return Response(response=message, status=200)
-        where = setValue(where, thisColumn, 'like', f'%{value}%', thisDatatype)
+        clauses.append(setValue('', thisColumn, 'like', f'%{value}%', thisDatatype))
     if 'inputNotContains' in request.form:
-        thisValue = convertInWeb(request.form['inputContains'].strip())
+        thisValue = convertInWeb(request.form['inputNotContains'].strip())
         if (value := testValue(thisValue, thisDatatype)) is None:
             message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
             return Response(response=message, status=200)
-        where = setValue(where, thisColumn, 'not like', f'%{value}%', thisDatatype)
+        clauses.append(setValue('', thisColumn, 'not like', f'%{value}%', thisDatatype))
+    if ('inputInList' in request.form) or ('inputInListFile' in request.files):
+        listText = request.form.get('inputInList', '')
+        if ('inputInListFile' in request.files) and (request.files['inputInListFile'].filename != ''):
+            listText += '\n' + request.files['inputInListFile'].read().decode('utf-8-sig', errors='replace')
+        values = []
+        for thisValue in splitList(listText):
+            if (value := testValue(thisValue, thisDatatype)) is None:
+                message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
+                return Response(response=message, status=200)
+            values.append(value)
+        if len(values) == 0:
+            message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, '(an empty list)', thisDatatype, thisColumnName)
+            return Response(response=message, status=200)
+        clauses.append(setInList('', thisColumn, values, thisDatatype))
     if ('inputInRangeLow' in request.form) or ('inputInRangeHigh' in request.form):
-        if ('InputInRangeLow' not in request.form) or ('inputInRangeHigh' not in request.form):
+        if ('inputInRangeLow' not in request.form) or ('inputInRangeHigh' not in request.form):
             message += f'<form id="tables" action ="{url_for("doNextConstraint")}" method="post" enctype="multipart/form-data">'
             message += f'<input id="table" type="hidden" name="table" value="{thisTable}">'
             message += f'<input id="columnsSelected" type="hidden" name="columnsSelected" value="{columnsSelected}">'
             message += f'<input id="constrainedColumn" type="hidden" name="constrainedColumns" value="{constrainedColumns}">'
             message += f'<input id="nextConstraint" type="hidden" name="nextConstraint" value="{nextConstraint}">'
-            message += f'<input id="where" type="hidden" name="where" value="{whereWas}">'
+            message += whereFields(whereWas)
             message += '<input id="submit" type="submit" name="select" value="Incomplete range specification - click here to try again" style="font-size:120%">'
             message += '</form>'
             message += '</body></html>'
@@ -594,17 +968,48 @@ def setConstraints():
             message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
             return Response(response=message, status=200)
         if 'lowRangeExclude' in request.form:
-            where = setValue(where, thisColumn, '>', value, thisDatatype)
+            rangeWhere = setValue('', thisColumn, '>', value, thisDatatype)
         else:
-            where = setValue(where, thisColumn, '>=', value, thisDatatype)
+            rangeWhere = setValue('', thisColumn, '>=', value, thisDatatype)
         thisValue = convertInWeb(request.form['inputInRangeHigh'].strip())
         if (value := testValue(thisValue, thisDatatype)) is None:
             message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
             return Response(response=message, status=200)
         if 'highRangeExclude' in request.form:
-            where = setValue(where, thisColumn, '<', value, thisDatatype)
+            rangeWhere = setValue(rangeWhere, thisColumn, '<', value, thisDatatype)
+        else:
+            rangeWhere = setValue(rangeWhere, thisColumn, '<=', value, thisDatatype)
+        clauses.append(rangeWhere)
+    if ('inputNotInRangeLow' in request.form) or ('inputNotInRangeHigh' in request.form):
+        if ('inputNotInRangeLow' not in request.form) or ('inputNotInRangeHigh' not in request.form):
+            message += f'<form id="tables" action ="{url_for("doNextConstraint")}" method="post" enctype="multipart/form-data">'
+            message += f'<input id="table" type="hidden" name="table" value="{thisTable}">'
+            message += f'<input id="columnsSelected" type="hidden" name="columnsSelected" value="{columnsSelected}">'
+            message += f'<input id="constrainedColumn" type="hidden" name="constrainedColumns" value="{constrainedColumns}">'
+            message += f'<input id="nextConstraint" type="hidden" name="nextConstraint" value="{nextConstraint}">'
+            message += whereFields(whereWas)
+            message += '<input id="submit" type="submit" name="select" value="Incomplete range specification - click here to try again" style="font-size:120%">'
+            message += '</form>'
+            message += '</body></html>'
+            return Response(response=message, status=200)
+        thisValue = convertInWeb(request.form['inputNotInRangeLow'].strip())
+        if (value := testValue(thisValue, thisDatatype)) is None:
+            message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
+            return Response(response=message, status=200)
+        if 'lowNotRangeInclude' in request.form:
+            lowWhere = setValue('', thisColumn, '<=', value, thisDatatype)
+        else:
+            lowWhere = setValue('', thisColumn, '<', value, thisDatatype)
+        thisValue = convertInWeb(request.form['inputNotInRangeHigh'].strip())
+        if (value := testValue(thisValue, thisDatatype)) is None:
+            message += redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where, thisValue, thisDatatype, thisColumnName)
+            return Response(response=message, status=200)
+        if 'highNotRangeInclude' in request.form:
+            highWhere = setValue('', thisColumn, '>=', value, thisDatatype)
         else:
-            where = setValue(where, thisColumn, '<=', value, thisDatatype)
+            highWhere = setValue('', thisColumn, '>', value, thisDatatype)
+        clauses.append(f'({lowWhere} OR {highWhere})')
+    where = addClauses(where, clauses, 'anyConstraint' in request.form)
     nextConstraint += 1
     if nextConstraint < len(constrainedColumns):
         message += makeConstraint(thisTable, columnsSelected, constrainedColumns, nextConstraint, where)
@@ -622,7 +1027,7 @@ def redoThisConstraint(thisTable, columnsSelected, constrainedColumns, nextConst
     message += f'<input id="columnsSelected" type="hidden" name="columnsSelected" value="{columnsSelected}">'
     message += f'<input id="constrainedColumn" type="hidden" name="table" value="{constrainedColumns}">'
     message += f'<input id="nextConstraint" type="hidden" name="table" value="{nextConstraint}">'
-    message += f"<input id='where' type='hidden' name='where' value='{where}'>"
+    message += whereFields(where)
     message += f'<input id="submit" type="select" name="select" value="Value {value} is not valid for the datatype({thisDatatype}) for column {thisColumnName} - click here to try again">'
     message += '</form>'
     message += '</body></html>'
@@ -633,27 +1038,84 @@ def buildAggs(thisTable, columnsSelected, where):
     Build the "select columns to aggregate" web page
     '''
     message = '<h2 style="text-align:center">Please select any columns you want counted and/or summed in your mined data</h2>'
+    allWhere = combineWhere(request.form.get('orWhere', '').strip(), where)
+    estimate = estimateRecords(thisTable, allWhere)
+    bounds = boundRecords(thisTable, allWhere)
+    if (estimate is not None) and (bounds is not None):
+        message += f'<p style="text-align:center">Your constraints are estimated to match about {estimate:,} (between {bounds[0]:,} and {bounds[1]:,}) of the {d.columnStats[thisTable]["rows"]:,} records [limit:{currentConfig().mineTables[thisTable]["maxRecords"]:,}]</p>'
     message += f'<form id="aggregates" action ="{url_for("doAggregates")}" method="post" enctype="multipart/form-data">'
     message += f'<input id="table" type="hidden" name="table" value="{thisTable}">'
     message += f'<input id="columnsSelected" type="hidden" name="columnsSelected" value="{columnsSelected}">'
-    message += f"<input id='where' type='hidden' name='where' value='{where}'>"
+    message += whereFields(where)
     message += '<table>'
     message += '<tr><th style="font-size:150%">Column</th><th style="font-size:150%">count()</th><th style="font-size:150%">sum()</th></tr>'
     for thisCol in columnsSelected:
-        if d.mineTables[thisTable]['columns'][thisCol]['datatype'] not in ['int', 'float', 'numeric', 'decimal']:
+        if currentConfig().mineTables[thisTable]['columns'][thisCol]['datatype'] not in ['int', 'float', 'numeric', 'decimal']:
             continue
-        columnName = d.mineTables[thisTable]["columns"][thisCol]['columnName']
+        columnName = currentConfig().mineTables[thisTable]["columns"][thisCol]['columnName']
         message += '<tr>'
         message += f'<td style="font-size:150%">{columnName}</td>'
         message += f'<td><input id="checked" type="checkbox" name="selectCount" value="{thisCol}"></td>'
         message += f'<td><input id="checked" type="checkbox" name="selectSum" value="{thisCol}"></td>'
         message += '</tr>'
     message += '</table>'
-    message += f'<input id="submit" type="submit" name="submit" value="Please count/sum these columns in the {d.mineTables[thisTable]["tableName"]} table" style="font-size:150%">'
+    message += '<br/>'
+    message += '<table>'
+    message += '<tr><td style="font-size:150%">Order your mined extract by</td><td><select name="orderBy" style="font-size:120%"><option value="">(no order)</option>'
+    for thisCol in columnsSelected:
+        columnName = currentConfig().mineTables[thisTable]["columns"][thisCol]['columnName']
+        message += f'<option value="{thisCol}">{columnName}</option>'
+        if currentConfig().mineTables[thisTable]['columns'][thisCol]['datatype'] in ['int', 'float', 'numeric', 'decimal']:
+            message += f'<option value="count:{thisCol}">count({columnName})</option>'
+            message += f'<option value="sum:{thisCol}">sum({columnName})</option>'
+    message += '</select></td>'
+    message += '<td><input id="orderDescending" type="checkbox" name="orderDescending"></td><td>Largest first</td></tr>'
+    message += '<tr><td style="font-size:150%">Only include the first rows (leave blank for all rows)</td><td><input id="topN" type="text" name="topN"></td></tr>'
+    message += '<tr><td style="font-size:150%">Only mine a random sample of (leave blank for all rows)</td><td><input id="sampleSize" type="text" name="sampleSize"></td>'
+    message += '<td><select name="sampleType" style="font-size:120%"><option value="rows">rows</option><option value="percent">percent of the rows</option></select></td></tr>'
+    message += '</table>'
+    message += f'<input id="submit" type="submit" name="submit" value="Please count/sum these columns in the {currentConfig().mineTables[thisTable]["tableName"]} table" style="font-size:150%">'
     message += '</form>'
+    if (where is not None) and (where != ''):
+        message += f'<form id="orGroup" action ="{url_for("doOrGroup")}" method="post" enctype="multipart/form-data">'
+        message += f'<input id="table" type="hidden" name="table" value="{thisTable}">'
+        message += f'<input id="columnsSelected" type="hidden" name="columnsSelected" value="{columnsSelected}">'
+        message += whereFields(where)
+        message += '<input id="submit" type="submit" name="submit" value="Or, also include data that matches an alternative set of constraints (OR)" style="font-size:150%">'
+        message += '</form>'
     message += '</body></html>'
     return message
 
+def columnWidth(columnType):
+    '''
+    Estimate the number of bytes in the extract for one value from a column of this (reflected) type
+    '''
+    if isinstance(columnType, types.String):
+        if columnType.length is not None:
+            return columnType.length
+        return 255
+    if isinstance(columnType, types.SmallInteger):
+        return 2
+    if isinstance(columnType, (types.Integer, types.Float, types.Date)):
+        return 8
+    if isinstance(columnType, (types.Numeric, types.DateTime, types.Time)):
+        return 16
+    if isinstance(columnType, types.Boolean):
+        return 1
+    return 32
+
+
+def estimateBytes(thisTable, columnsSelected, rowCount):
+    '''
+    Estimate the size, in bytes, of an extract of these columns with this many rows
+    '''
+    dbColumns = currentConfig().metadata.tables[thisTable].columns
+    rowWidth = 0
+    for col in columnsSelected:
+        rowWidth += columnWidth(dbColumns[currentConfig().mineTables[thisTable]['columns'][int(col)]['column']].type)
+    return rowCount * rowWidth
+
+
 @app.route('/doAggregates', methods=['POST'])
 def doAggregates():
     '''
@@ -666,19 +1128,135 @@ def doAggregates():
         message += thisMessage
         return Response(response=message, status=400)
     where = convertInWeb(request.form['where'].strip())
-    selectColumns = ''
-    groupByColumns = ''
+    orWhere = request.form.get('orWhere', '').strip()
+    if orWhere != '':
+        where = combineWhere(orWhere, where)
     countThese = []
     sumThese = []
-    if ('selectCount' in request.form) or ('selectSum' in request.form):
-        if 'selectCount' in request.form:
-            for countIt in request.form.getlist('selectCount'):
-                countThese.append(int(countIt))
-        if 'selectSum' in request.form:
-            for sumIt in request.form.getlist('selectSum'):
-                sumThese.append(int(sumIt))
+    if 'selectCount' in request.form:
+        for countIt in request.form.getlist('selectCount'):
+            countThese.append(int(countIt))
+    if 'selectSum' in request.form:
+        for sumIt in request.form.getlist('selectSum'):
+            sumThese.append(int(sumIt))
+    selectColumns, groupByColumns = buildSelect(thisTable, columnsSelected, countThese, sumThese)
+    orderBy = ''
+    if request.form.get('orderBy', '') != '':
+        orderBy = orderExpression(thisTable, request.form['orderBy'], 'orderDescending' in request.form)
+        if orderBy.split(' ')[0] not in selectColumns.split(', '):
+            message += f'<p style="text-align:centre"><b><a href="{url_for("splash")}">You can only order your mined extract by a column that is in it ({orderBy.split(" ")[0]}) - please click here to start again</a></b>'
+            message += '</body></html>'
+            return Response(response=message, status=400)
+    topN = None
+    if request.form.get('topN', '').strip() != '':
+        topN = convertInWeb(request.form['topN'].strip())
+        if (not isinstance(topN, int)) or (topN < 1):
+            message += f'<p style="text-align:centre"><b><a href="{url_for("splash")}">The number of rows to include ({topN}) must be a whole number - please click here to start again</a></b>'
+            message += '</body></html>'
+            return Response(response=message, status=400)
+    sampleSize = None
+    sampleType = request.form.get('sampleType', 'rows')
+    if request.form.get('sampleSize', '').strip() != '':
+        sampleSize = convertInWeb(request.form['sampleSize'].strip())
+        if (len(countThese) > 0) or (len(sumThese) > 0):
+            message += f'<p style="text-align:centre"><b><a href="{url_for("splash")}">A random sample cannot be counted or summed - please click here to start again</a></b>'
+            message += '</body></html>'
+            return Response(response=message, status=400)
+        if sampleType == 'percent':
+            if isinstance(sampleSize, bool) or (not isinstance(sampleSize, (int, float))) or (sampleSize <= 0) or (sampleSize > 100):
+                message += f'<p style="text-align:centre"><b><a href="{url_for("splash")}">The percentage of rows to sample ({sampleSize}) must be a number between 0 and 100 - please click here to start again</a></b>'
+                message += '</body></html>'
+                return Response(response=message, status=400)
+        elif (not isinstance(sampleSize, int)) or (sampleSize < 1):
+            message += f'<p style="text-align:centre"><b><a href="{url_for("splash")}">The number of rows to sample ({sampleSize}) must be a whole number - please click here to start again</a></b>'
+            message += '</body></html>'
+            return Response(response=message, status=400)
+    # Reject extracts that the column statistics show must access too many records, without counting them
+    bounds = boundRecords(thisTable, where)
+    if bounds is not None:
+        fewest = bounds[0]
+        if (topN is not None) and (groupByColumns == '') and (len(countThese) == 0) and (len(sumThese) == 0):
+            fewest = min(fewest, topN)
+        if sampleSize is not None:
+            if sampleType == 'percent':
+                fewest = math.floor(fewest * sampleSize / 100)
+            else:
+                fewest = min(fewest, sampleSize)
+        if fewest > currentConfig().mineTables[thisTable]['maxRecords']:
+            message += f'<p style="text-align:centre"><b><a href="{url_for("splash")}">Your mined extract would access too many records (at least {fewest:,}) [limit:{currentConfig().mineTables[thisTable]["maxRecords"]}] - please click here to start again</a></b>'
+            message += '</body></html>'
+            return Response(response=message, status=400)
+    extractCount_df = readSQL(countSQL(thisTable, where))
+    extractCount = int(extractCount_df['count'].iloc[0])
+
+    # Only mine a random sample of the records, if requested, using the database's own sampling
+    tableSample = ''
+    sampledRows = None
+    if sampleSize is not None:
+        if sampleType == 'percent':
+            sampleRows = math.ceil(extractCount * sampleSize / 100)
+        else:
+            sampleRows = sampleSize
+        if sampleRows < extractCount:
+            tableSample, sampleWhere = sampleParts(thisTable, sampleRows, extractCount)
+            if sampleWhere != '':
+                if (where is None) or (where == ''):
+                    where = sampleWhere
+                else:
+                    where = f'({where}) AND {sampleWhere}'
+            sampledRows = sampleRows
+        extractCount = min(extractCount, sampleRows)
+    message = '<h2 style="text-align:center">Here is your SQL query for mining your extract</h2>'
+    selectText = extractSQL(thisTable, selectColumns, where, groupByColumns, orderBy, topN, True, tableSample, sampledRows)
+    message += f'<br/><pre style="font-size:150%">{selectText}</pre>'
+    message += '<br/>'
+    if (topN is not None) and (groupByColumns == '') and (len(countThese) == 0) and (len(sumThese) == 0):
+        extractCount = min(extractCount, topN)
+    if extractCount > currentConfig().mineTables[thisTable]['maxRecords']:
+        message += f'<p style="text-align:centre"><b><a href="{url_for("splash")}">Your mined extract would access too many records "{extractCount}" [limit:{currentConfig().mineTables[thisTable]["maxRecords"]}] - please click here to start again</a></b>'
+        message += '</body></html>'
+        return Response(response=message, status=400)
+    selectText = extractSQL(thisTable, selectColumns, where, groupByColumns, orderBy, topN, False, tableSample, sampledRows)
+
+    # The SQL is carried in the download link, so it must fit in the request line that the web server will accept
+    linkLength = len(url_for("doSQL", SQL=selectText, table=thisTable, decode=1))
+    if linkLength > d.maxLinkLength:
+        message += f'<p style="text-align:centre"><b><a href="{url_for("splash")}">Your mined extract\'s SQL is too long for a download link ({linkLength:,} characters) [limit:{d.maxLinkLength:,}] - use a shorter list of values, or a batch extract - please click here to start again</a></b>'
+        message += '</body></html>'
+        return Response(response=message, status=400)
+
+    # Extracts that would be too big for an Excel workbook can only be streamed as CSV (aggregated extracts are never bigger than their groups)
+    maxBytes = currentConfig().mineTables[thisTable]['maxBytes']
+    if (maxBytes is not None) and (groupByColumns == '') and (len(countThese) == 0) and (len(sumThese) == 0):
+        extractBytes = estimateBytes(thisTable, columnsSelected, extractCount)
+        if extractBytes > maxBytes:
+            message += f'<p style="font-size:150%">Your mined extract would be too big for an Excel workbook (about {extractBytes:,} bytes) [limit:{maxBytes:,}]'
+            message += f'<p style="font-size:150%"><b><a href="{url_for("doSQL", SQL=selectText, table=thisTable, format="csv")}">Click here to execute this SQL, mine your extract and download it as a CSV file</a></b>'
+            message += f'<p style="font-size:150%"><b><a href="{url_for("splash")}">Click here to start a new data mining operation</a></b>'
+            message += '</body></html>'
+            return Response(response=message, status=200)
+    message += f'<p style="font-size:150%"><b><a href="{url_for("doSQL", SQL=selectText, table=thisTable)}">Click here to execute this SQL, mine your extract and download it</a></b>'
+    hasLookups = False
+    for col in columnsSelected:
+        thisCol = currentConfig().mineTables[thisTable]['columns'][int(col)]
+        if (thisCol['lookupTable'] is not None) and (col not in countThese) and (col not in sumThese):
+            hasLookups = True
+    if hasLookups:
+        message += f'<p style="font-size:150%"><b><a href="{url_for("doSQL", SQL=selectText, table=thisTable, decode=1)}">Click here to execute this SQL, mine your extract, add the descriptions for any codes and download it</a></b>'
+    message += f'<p style="font-size:150%"><b><a href="{url_for("splash")}">Click here to start a new data mining operation</a></b>'
+    message += '</body></html>'
+    return Response(response=message, status=200)
+
+
+def buildSelect(thisTable, columnsSelected, countThese, sumThese):
+    '''
+    Build the list of columns to select, and the list of columns to group by, for the selected, counted and summed columns
+    '''
+    selectColumns = ''
+    groupByColumns = ''
+    if (len(countThese) > 0) or (len(sumThese) > 0):
         for col in columnsSelected:
-            thisCol = d.mineTables[thisTable]['columns'][int(col)]
+            thisCol = currentConfig().mineTables[thisTable]['columns'][int(col)]
             thisColumn = thisCol['column']
             if (col in countThese) or (col in sumThese):
                 if col in countThese:
@@ -698,53 +1276,678 @@ def doAggregates():
                 groupByColumns += f'{thisColumn}'
     else:
         for col in columnsSelected:
-            thisCol = d.mineTables[thisTable]['columns'][int(col)]
+            thisCol = currentConfig().mineTables[thisTable]['columns'][int(col)]
             thisColumn = thisCol['column']
             if selectColumns != '':
                 selectColumns += ', '
             selectColumns += f'{thisColumn}'
-    message = '<h2 style="text-align:center">Here is your SQL query for mining your extract</h2>'
-    selectText = f'SELECT {selectColumns}\nFROM {thisTable}'
-    if (where is not None) and (where != ''):
-        thisWhere = where.replace(' AND ','\n      AND ')
-        selectText += f'\nWHERE {thisWhere}'
-    if groupByColumns != '':
-        selectText += f'\nGROUP BY {groupByColumns}'
-    message += f'<br/><pre style="font-size:150%">{selectText}</pre>'
-    message += '<br/>'
+    return selectColumns, groupByColumns
+
+
+def countSQL(thisTable, where):
+    '''
+    Build the SQL that counts the records that the mined extract would access
+    '''
     countSelectText = f'SELECT count(*) as count FROM {thisTable}'
     if (where is not None) and (where != ''):
         countSelectText += f' WHERE {where}'
-    extractCount_df = pd.read_sql_query(text(countSelectText), d.engine.connect())
-    for rowCount in extractCount_df.itertuples():
-        if rowCount.count > d.mineTables[thisTable]['maxRecords']:
-            message += f'<p style="text-align:centre"><b><a href="{url_for("splash")}">Your mined extract would access too many records "{rowCount.count}" [limit:{d.mineTables[thisTable]["maxRecords"]}] - please click here to start again</a></b>'
-            message += '</body></html>'
-            return Response(response=message, status=400)
-    selectText = f'SELECT {selectColumns} FROM {thisTable}'
+    return countSelectText
+
+
+def estimateRecords(thisTable, where):
+    '''
+    Estimate, from the column statistics, the number of records that 'where' would access
+    Returns None if there are no statistics for this table, or 'where' can't be estimated
+    '''
+    tableStats = d.columnStats.get(thisTable)
+    if tableStats is None:
+        return None
+    if (where is None) or (where == ''):
+        return tableStats['rows']
+    try:
+        fraction = WhereEstimator(where, tableStats['columns']).estimate()
+    except ValueError as thisE:
+        logging.debug('Cannot estimate the records matched by %s: %s', where, thisE)
+        return None
+    return int(round(tableStats['rows'] * fraction))
+
+
+def boundRecords(thisTable, where):
+    '''
+    The lower and upper bounds, from the column statistics, on the number of records that 'where' would access
+    Returns None if there are no statistics for this table, or 'where' can't be bounded
+    '''
+    tableStats = d.columnStats.get(thisTable)
+    if tableStats is None:
+        return None
+    if (where is None) or (where == ''):
+        return tableStats['rows'], tableStats['rows']
+    try:
+        lower, upper = WhereEstimator(where, tableStats['columns']).bounds()
+    except ValueError as thisE:
+        logging.debug('Cannot bound the records matched by %s: %s', where, thisE)
+        return None
+    return int(math.floor(tableStats['rows'] * lower)), int(math.ceil(tableStats['rows'] * upper))
+
+
+def extractSQL(thisTable, selectColumns, where, groupByColumns, orderBy='', topN=None, display=False, tableSample='', sampleRows=None):
+    '''
+    Build the SQL that mines the extract
+    Only the first topN rows are mined, using TOP for MSSQL and LIMIT for other databases
+    Any tableSample clause (MSSQL TABLESAMPLE) follows the table name
+    For a random sample, the over sized sample (from tableSample or a random constraint in where) is put in a random order
+    and cut down to sampleRows, then any orderBy and topN are applied to just those rows
+    If display then the SQL is laid out over several lines so that it can be shown to the user
+    '''
+    if sampleRows is not None:
+        if orderBy == '':
+            if topN is not None:
+                sampleRows = min(sampleRows, topN)
+            return extractSQL(thisTable, selectColumns, where, groupByColumns, randomOrder(), sampleRows, display, tableSample)
+        sampleText = extractSQL(thisTable, selectColumns, where, groupByColumns, randomOrder(), sampleRows, display, tableSample)
+        return extractSQL(f'({sampleText}) AS sampled', selectColumns, '', '', orderBy, topN, display)
+    newline = ' '
+    thisWhere = where
+    if display:
+        newline = '\n'
+        if (where is not None) and (where != ''):
+            thisWhere = where.replace(' AND ','\n      AND ').replace(') OR (', ')\n   OR (')
+    selectText = 'SELECT '
+    if (topN is not None) and (d.engine.dialect.name == 'mssql'):
+        selectText += f'TOP {topN} '
+    selectText += f'{selectColumns}{newline}FROM {thisTable}'
+    if tableSample != '':
+        selectText += f' {tableSample}'
     if (where is not None) and (where != ''):
-        selectText += f' WHERE {where}'
+        selectText += f'{newline}WHERE {thisWhere}'
     if groupByColumns != '':
-        selectText += f' GROUP BY {groupByColumns}'
-    message += f'<p style="font-size:150%"><b><a href="{url_for("doSQL", SQL=selectText)}">Click here to execute this SQL, mine your extract and download it</a></b>'
-    message += f'<p style="font-size:150%"><b><a href="{url_for("splash")}">Click here to start a new data mining operation</a></b>'
-    message += '</body></html>'
-    return Response(response=message, status=200)
+        selectText += f'{newline}GROUP BY {groupByColumns}'
+    if orderBy != '':
+        selectText += f'{newline}ORDER BY {orderBy}'
+    if (topN is not None) and (d.engine.dialect.name != 'mssql'):
+        selectText += f'{newline}LIMIT {topN}'
+    return selectText
 
 
-@app.route('/doSQL/<SQL>', methods=['GET'])
-def doSQL(SQL):
+# A counted/summed extract, as built by extractSQL, without any ORDER BY, TOP or LIMIT
+AGGREGATE_SQL = re.compile(r'^SELECT (?!TOP )(?P<select>.+?) FROM (?P<table>\w+)(?: WHERE (?P<where>.+))? GROUP BY (?P<groupBy>\w+(?:, \w+)*)$', re.DOTALL)
+
+
+def readAggregate(thisTable, selectColumns, where, groupByColumns):
     '''
-    Execute the SQL and download the resulting Excel workbook
+    Run a counted/summed extract, answering it from the kept counts and sums if possible
+    Otherwise the extract is run grouped by its grouping columns plus any whole number columns constrained to a list of values,
+    and those counts and sums are kept, before being re-summed to answer this extract
+    '''
+    if d.aggregateCache is None:
+        return readSQL(extractSQL(thisTable, selectColumns, where, groupByColumns))
+    try:
+        query = AggregateQuery(thisTable, selectColumns, where, groupByColumns, {thisCol['column']:thisCol['datatype'] for thisCol in currentConfig().mineTables[thisTable]['columns']})
+    except ValueError as thisE:
+        logging.debug('Cannot keep the counts and sums of %s: %s', selectColumns, thisE)
+        return readSQL(extractSQL(thisTable, selectColumns, where, groupByColumns))
+    partial_df = d.aggregateCache.find(query)
+    if partial_df is None:
+        partialColumns = query.grain + [f'{function}({column})' for function, column in query.aggregates]
+        partial_df = readSQL(extractSQL(thisTable, ', '.join(partialColumns), where, ', '.join(query.grain))).set_axis(partialColumns, axis=1)
+        d.aggregateCache.add(query, partial_df)
+        return query.regroup(partial_df)            # The database has already applied this extract's constraints
+    logging.info('Extract from table "%s" answered from kept counts and sums', thisTable)
+    return query.resum(partial_df)
+
+
+def sampleParts(thisTable, sampleRows, extractCount):
+    '''
+    Build the sampling for an extract of about sampleRows random rows, from the extractCount rows that match the constraints
+    MSSQL tables sample pages (TABLESAMPLE), everything else (including MSSQL views, which can't be sampled by page)
+    samples the rows as they are scanned
+    The sample is over sized, and then put in a random order and cut down to sampleRows (see extractSQL)
+    Returns the TABLESAMPLE clause and the sampling constraint
+    '''
+    fraction = (2 * sampleRows + 10) / extractCount
+    if fraction >= 1.0:             # Most of the rows - randomly order all of them
+        return '', ''
+    if (d.engine.dialect.name == 'mssql') and not isView(thisTable):
+        return f'TABLESAMPLE ({100.0 * fraction:.6f} PERCENT)', ''
+    return '', rowSample(fraction)
+
+
+def rowSample(fraction):
+    '''
+    Build the constraint that randomly includes this fraction of the rows
+    '''
+    if d.engine.dialect.name == 'mssql':
+        return f'ABS(CHECKSUM(NEWID())) % 1000000 < {round(fraction * 1000000)}'
+    if d.engine.dialect.name == 'mysql':
+        return f'RAND() < {fraction:.8f}'
+    return f'ABS(RANDOM()) % 1000000 < {round(fraction * 1000000)}'
+
+
+def randomOrder():
+    '''
+    The ORDER BY expression that puts the rows in a random order
+    '''
+    if d.engine.dialect.name == 'mssql':
+        return 'NEWID()'
+    if d.engine.dialect.name == 'mysql':
+        return 'RAND()'
+    return 'RANDOM()'
+
+
+def isView(thisTable):
+    '''
+    Check if this minable table is a database view, rather than a base table
+    '''
+    config = currentConfig()
+    if config.viewNames is None:
+        config.viewNames = {viewName.lower() for viewName in inspect(d.engine).get_view_names()}
+    return thisTable.lower() in config.viewNames
+
+
+def orderExpression(thisTable, orderBy, descending):
+    '''
+    Build the ORDER BY expression for an "order by" selection - a column number, optionally prefixed with "count:" or "sum:"
+    '''
+    aggregate = None
+    if ':' in orderBy:
+        aggregate, orderBy = orderBy.split(':', 1)
+    thisColumn = currentConfig().mineTables[thisTable]['columns'][int(orderBy)]['column']
+    if aggregate is not None:
+        thisColumn = f'{aggregate}({thisColumn})'
+    if descending:
+        thisColumn += ' DESC'
+    return thisColumn
+
+
+def decodeLookups(thisTable, extract_df):
+    '''
+    Return a copy of the extract with a description column next to each column that contains codes from a lookup table
+    '''
+    extract_df = extract_df.copy()
+    for thisCol in currentConfig().mineTables[thisTable]['columns']:
+        if (thisCol['lookupTable'] is None) or (thisCol['column'] not in extract_df.columns):
+            continue
+        codes = getLookupCodes(thisCol)
+        at = extract_df.columns.get_loc(thisCol['column']) + 1
+        extract_df.insert(at, f'{thisCol["column"]}_description', extract_df[thisCol['column']].map(codes))
+    return extract_df
+
+
+def streamCSV(SQL):
+    '''
+    Stream the extract as CSV, a chunk of rows at a time, so that the whole extract is never held in memory
+    '''
+    with d.engine.connect() as conn:
+        header = True
+        for chunk_df in pd.read_sql_query(text(SQL), conn.execution_options(stream_results=True), chunksize=d.streamChunk):
+            yield chunk_df.to_csv(index=False, header=header)
+            header = False
+
+
+def extractWorkbook(extract_df):
+    '''
+    Write the extract to an in memory Excel workbook
     '''
-    extract_df = pd.read_sql_query(text(SQL), d.engine.connect())
     buffer = io.BytesIO()
     with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
         extract_df.to_excel(writer, index=False)
     buffer.seek(0)
+    return buffer
+
+
+@app.route('/doSQL/<SQL>', methods=['GET'])
+def doSQL(SQL):
+    '''
+    Execute the SQL and download the resulting Excel workbook
+    '''
+    thisTable = request.args.get('table')
+    user = request.remote_user or request.remote_addr
+    tableLimit = None
+    if thisTable in currentConfig().mineTables:
+        tableLimit = currentConfig().mineTables[thisTable]['maxExtracts']
+    if d.extractLimiter is not None:
+        rejected, position = d.extractLimiter.acquire(thisTable, user, tableLimit, f'{user} {request.full_path}')
+        if position is not None:        # Still waiting - show the user their place in the queue and come back for it
+            message = '<html><head><title>Simple Data Miner</title><meta http-equiv="refresh" content="1"><link rel="icon" href="data:,"></head><body style="font-size:120%">'
+            message += '<h1 style="text-align:center">Simple Data Miner</h1>'
+            message += f'<p style="text-align:centre"><b>The database is busy - your extract is at position {position} in the queue. This page will refresh until your extract runs</b>'
+            message += f'<p style="font-size:150%"><b><a href="{url_for("splash")}">Click here to start a new data mining operation</a></b>'
+            message += '</body></html>'
+            return Response(response=message, status=202, headers={'Retry-After':'1'})
+        if rejected is not None:
+            message = '<html><head><title>Simple Data Miner</title><link rel="icon" href="data:,"></head><body style="font-size:120%">'
+            message += '<h1 style="text-align:center">Simple Data Miner</h1>'
+            message += f'<p style="text-align:centre"><b>{rejected}</b>'
+            message += f'<p style="font-size:150%"><b><a href="{request.full_path}">Click here to try this extract again</a></b>'
+            message += f'<p style="font-size:150%"><b><a href="{url_for("splash")}">Click here to start a new data mining operation</a></b>'
+            message += '</body></html>'
+            return Response(response=message, status=503)
+    if request.args.get('format') == 'csv':
+        response = Response(streamCSV(SQL), mimetype='text/csv', headers={'Content-Disposition':'attachment; filename=SimpleDataMinerExtract.csv'})
+        if (limiter := d.extractLimiter) is not None:       # Released when the response is closed, even if the CSV is never streamed (e.g. a HEAD request)
+            response.call_on_close(lambda: limiter.release(thisTable, user))
+        return response
+    try:
+        if (aggregate := AGGREGATE_SQL.match(SQL)) and (aggregate.group('table') == thisTable) and (thisTable in currentConfig().mineTables):
+            extract_df = readAggregate(thisTable, aggregate.group('select'), aggregate.group('where'), aggregate.group('groupBy'))
+        else:
+            extract_df = readSQL(SQL)
+        if ('decode' in request.args) and (thisTable in currentConfig().mineTables):
+            extract_df = decodeLookups(thisTable, extract_df)
+    finally:
+        if d.extractLimiter is not None:
+            d.extractLimiter.release(thisTable, user)
+    buffer = extractWorkbook(extract_df)
     return send_file(buffer, as_attachment=True, download_name='SimpleDataMinerExtract.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
 
+def specWhere(thisTable, constraints):
+    '''
+    Build the where clause for the constraints in a batch query spec
+    Each constraint is a dictionary of "column", "constraint" (the same constraint types as the web site, or "codes")
+    and "value", "values" (for "codes" and "inList") or "low", "high", "lowExclude" and "highExclude" (for "inRange")
+    or "low", "high", "lowInclude" and "highInclude" (for "notInRange").
+    A constraint can also be {"any": [constraints]}, which matches data that matches any of those constraints
+    Returns the where clause and None, or None and an error message
+    '''
+    where = ''
+    for constraint in constraints:
+        if 'any' in constraint:
+            clauses = []
+            for anyConstraint in constraint['any']:
+                clause, errorMessage = specClause(thisTable, anyConstraint)
+                if errorMessage is not None:
+                    return None, errorMessage
+                clauses.append(clause)
+            where = addClauses(where, clauses, True)
+        else:
+            clause, errorMessage = specClause(thisTable, constraint)
+            if errorMessage is not None:
+                return None, errorMessage
+            where = addClause(where, clause)
+    return where, None
+
+
+def specClause(thisTable, constraint):
+    '''
+    Build the SQL for one constraint in a batch query spec
+    Returns the SQL and None, or None and an error message
+    '''
+    relops = {'equals':('=', '{}'), 'notEquals':('!=', '{}'), 'gtThan':('>', None), 'gteThan':('>=', None), 'ltThan':('<', None), 'lteThan':('<=', None),
+              'starts':('like', '{}%'), 'ends':('like', '%{}'), 'contains':('like', '%{}%'), 'notContains':('not like', '%{}%')}
+    columns = {thisCol['column']:thisCol for thisCol in currentConfig().mineTables[thisTable]['columns']}
+    if constraint.get('column') not in columns:
+        return None, f'Unknown column "{constraint.get("column")}" in constraint'
+    thisCol = columns[constraint['column']]
+    thisColumn = thisCol['column']
+    thisDatatype = thisCol['datatype']
+    constraintType = constraint.get('constraint')
+    if constraintType == 'codes':
+        if (thisDatatype != 'string') or (thisCol['lookupTable'] is None):
+            return None, f'Column "{thisColumn}" does not have a lookup table of codes'
+        return setInList('', thisColumn, constraint.get('values', []), 'string'), None
+    if constraintType == 'inList':
+        values = []
+        for thisValue in constraint.get('values', []):
+            if (value := testValue(thisValue, thisDatatype)) is None:
+                return None, f'Value {thisValue} is not valid for the datatype({thisDatatype}) for column {thisColumn}'
+            values.append(value)
+        if len(values) == 0:
+            return None, f'Empty list of values for column {thisColumn}'
+        return setInList('', thisColumn, list(dict.fromkeys(values)), thisDatatype), None
+    if constraintType in ['inRange', 'notInRange']:
+        if thisDatatype == 'string':
+            return None, f'Constraint type "{constraintType}" is not valid for string column "{thisColumn}"'
+        if constraintType == 'inRange':
+            bounds = [('low', 'lowExclude', '>=', '>'), ('high', 'highExclude', '<=', '<')]
+        else:
+            bounds = [('low', 'lowInclude', '<', '<='), ('high', 'highInclude', '>', '>=')]
+        clauses = []
+        for bound, option, relop, relopOption in bounds:
+            if (constraint.get(bound) is None) or ((value := testValue(constraint[bound], thisDatatype)) is None):
+                return None, f'Value {constraint.get(bound)} is not valid for the datatype({thisDatatype}) for column {thisColumn}'
+            clauses.append(setValue('', thisColumn, relopOption if constraint.get(option) else relop, value, thisDatatype))
+        if constraintType == 'inRange':
+            return ' AND '.join(clauses), None
+        return '(' + ' OR '.join(clauses) + ')', None
+    if constraintType in relops:
+        relop, pattern = relops[constraintType]
+        if (pattern is None) and (thisDatatype == 'string'):
+            return None, f'Constraint type "{constraintType}" is not valid for string column "{thisColumn}"'
+        if (relop in ['like', 'not like']) and (thisDatatype != 'string'):
+            return None, f'Constraint type "{constraintType}" is only valid for string columns, not column "{thisColumn}"'
+        if (constraint.get('value') is None) or ((value := testValue(constraint['value'], thisDatatype)) is None):
+            return None, f'Value {constraint.get("value")} is not valid for the datatype({thisDatatype}) for column {thisColumn}'
+        if relop in ['like', 'not like']:
+            value = pattern.format(value)
+        return setValue('', thisColumn, relop, value, thisDatatype), None
+    return None, f'Unknown constraint type "{constraintType}"'
+
+
+def writeExtract(extract_df, outputFile, outputFormat):
+    '''
+    Write a batch extract to a file
+    '''
+    if outputFormat == 'csv':
+        extract_df.to_csv(outputFile, index=False)
+    else:
+        with open(outputFile, 'wb') as outputTarget:
+            outputTarget.write(extractWorkbook(extract_df).getbuffer())
+
+
+def runSpec(specNo, spec, outputDir):
+    '''
+    Run one batch query spec and write the extract to the output directory
+    Returns the spec name, the status, the number of rows and the elapsed seconds
+    '''
+    start = time.monotonic()
+    name = f'extract{specNo}'
+    try:        # A malformed spec fails on its own, without stopping the rest of the batch
+        if not isinstance(spec, dict):
+            return name, 'The query spec is not a dictionary', 0, time.monotonic() - start
+        name = str(spec.get('name', name))
+        for key in ['columns', 'count', 'sum', 'constraints', 'alternatives']:
+            if not isinstance(spec.get(key, []), list):
+                return name, f'"{key}" must be a list', 0, time.monotonic() - start
+        if (spec.get('orderBy') is not None) and not isinstance(spec['orderBy'], dict):
+            return name, '"orderBy" must be a dictionary', 0, time.monotonic() - start
+        thisTable = spec.get('table')
+        if thisTable not in currentConfig().mineTables:
+            return name, f'Unknown table "{thisTable}"', 0, time.monotonic() - start
+        columns = {thisCol['column']:i for i, thisCol in enumerate(currentConfig().mineTables[thisTable]['columns'])}
+        for column in spec.get('columns', []) + spec.get('count', []) + spec.get('sum', []):
+            if column not in columns:
+                return name, f'Unknown column "{column}"', 0, time.monotonic() - start
+        columnsSelected = [columns[column] for column in spec.get('columns', [])]
+        if len(columnsSelected) == 0:
+            return name, 'No columns selected', 0, time.monotonic() - start
+        countThese = [columns[column] for column in spec.get('count', [])]
+        sumThese = [columns[column] for column in spec.get('sum', [])]
+        for col in countThese + sumThese:
+            if (col not in columnsSelected) or (currentConfig().mineTables[thisTable]['columns'][col]['datatype'] not in ['int', 'float', 'numeric', 'decimal']):
+                return name, f'Column "{currentConfig().mineTables[thisTable]["columns"][col]["column"]}" cannot be counted or summed', 0, time.monotonic() - start
+        outputFormat = spec.get('format', 'xlsx')
+        if outputFormat not in ['xlsx', 'csv']:
+            return name, f'Unknown output format "{outputFormat}"', 0, time.monotonic() - start
+        where, errorMessage = specWhere(thisTable, spec.get('constraints', []))
+        if errorMessage is not None:
+            return name, errorMessage, 0, time.monotonic() - start
+        if len(spec.get('alternatives', [])) > 0:
+            orWhere = combineWhere('', where)
+            for alternative in spec['alternatives']:
+                alternativeWhere, errorMessage = specWhere(thisTable, alternative)
+                if errorMessage is not None:
+                    return name, errorMessage, 0, time.monotonic() - start
+                orWhere = combineWhere(orWhere, alternativeWhere)
+            where = orWhere
+        selectColumns, groupByColumns = buildSelect(thisTable, columnsSelected, countThese, sumThese)
+        orderBy = ''
+        if spec.get('orderBy') is not None:
+            orderSpec = spec['orderBy']
+            if orderSpec.get('column') not in columns:
+                return name, f'Unknown order by column "{orderSpec.get("column")}"', 0, time.monotonic() - start
+            orderBy = str(columns[orderSpec['column']])
+            if orderSpec.get('aggregate') is not None:
+                if orderSpec['aggregate'] not in ['count', 'sum']:
+                    return name, f'Unknown order by aggregate "{orderSpec["aggregate"]}"', 0, time.monotonic() - start
+                orderBy = f'{orderSpec["aggregate"]}:{orderBy}'
+            orderBy = orderExpression(thisTable, orderBy, orderSpec.get('descending', False))
+            if orderBy.split(' ')[0] not in selectColumns.split(', '):
+                return name, f'Cannot order by "{orderBy.split(" ")[0]}" as it is not in the extract', 0, time.monotonic() - start
+        topN = spec.get('top')
+        if (topN is not None) and ((not isinstance(topN, int)) or (topN < 1)):
+            return name, f'The number of rows to include ({topN}) must be a whole number', 0, time.monotonic() - start
+        extractCount_df = readSQL(countSQL(thisTable, where))
+        extractCount = int(extractCount_df['count'].iloc[0])
+        if (topN is not None) and (groupByColumns == '') and (len(countThese) == 0) and (len(sumThese) == 0):
+            extractCount = min(extractCount, topN)
+        if extractCount > currentConfig().mineTables[thisTable]['maxRecords']:
+            return name, f'Too many records "{extractCount}" [limit:{currentConfig().mineTables[thisTable]["maxRecords"]}]', 0, time.monotonic() - start
+        maxBytes = currentConfig().mineTables[thisTable]['maxBytes']
+        if (outputFormat == 'xlsx') and (maxBytes is not None) and (groupByColumns == '') and (len(countThese) == 0) and (len(sumThese) == 0):
+            extractBytes = estimateBytes(thisTable, columnsSelected, extractCount)
+            if extractBytes > maxBytes:         # Too big for an Excel workbook, so write it as CSV
+                logging.warning('Batch extract "%s" would be too big for an Excel workbook (about %d bytes) [limit:%d] - writing it as CSV', name, extractBytes, maxBytes)
+                outputFormat = 'csv'
+        if (groupByColumns != '') and (orderBy == '') and (topN is None):
+            extract_df = readAggregate(thisTable, selectColumns, where, groupByColumns)
+        else:
+            extract_df = readSQL(extractSQL(thisTable, selectColumns, where, groupByColumns, orderBy, topN))
+        if spec.get('decode'):
+            extract_df = decodeLookups(thisTable, extract_df)
+        writeExtract(extract_df, os.path.join(outputDir, f'{name}.{outputFormat}'), outputFormat)
+    except Exception as thisE:
+        return name, f'Failed: {thisE}', 0, time.monotonic() - start
+    return name, 'OK', len(extract_df), time.monotonic() - start
+
+
+def runBatch(specs, outputDir, jobs):
+    '''
+    Run all the batch query specs concurrently, with no more than "jobs" of them using the database at the one time
+    '''
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(lambda numberedSpec: runSpec(numberedSpec[0], numberedSpec[1], outputDir), enumerate(specs)))
+
+
+def readWorksheet(wb, worksheet):
+    '''
+    Read a worksheet from the configuration workbook into a pandas DataFrame
+    '''
+    ws = wb[worksheet]
+    data = ws.values
+    cols = next(data)
+    return pd.DataFrame(list(data), columns=cols)
+
+
+def reflectTable(thisMetadata, table):
+    '''
+    Return the database table from this metadata, reflecting it from the database if required
+    Returns None if the table is not in the database
+    '''
+    if table in thisMetadata.tables:
+        return thisMetadata.tables[table]
+    try:
+        return Table(table, thisMetadata, autoload_with=d.engine)
+    except NoSuchTableError:
+        return None
+
+
+def checkTableConfig(thisMetadata, table, tableName, maxRecords, maxExtracts, maxBytes, thisTable_df, worksheet):
+    '''
+    Check the configuration of one table against the database and build its mineTables entry
+    Returns the entry and None, or None and an error message
+    '''
+    for heading in ['column', 'columnName', 'datatype', 'isIndexed', 'lookupTable', 'lookupCodeColumn', 'lookupDescriptionColumn']:
+        if heading not in thisTable_df.columns:
+            return None, f'Missing "{heading}" heading in "{worksheet}" worksheet'
+    dbTable = reflectTable(thisMetadata, table)
+    mineTable = {}
+    mineTable['tableName'] = tableName
+    mineTable['maxRecords'] = maxRecords
+    mineTable['maxExtracts'] = maxExtracts
+    mineTable['maxBytes'] = maxBytes
+    mineTable['columns'] = []
+    for columnRow in thisTable_df.itertuples():
+        if columnRow.column not in dbTable.columns:
+            return None, f'No column named "{columnRow.column}" in table "{table}" not in database'
+        if columnRow.lookupTable is not None:
+            lookupTable = reflectTable(thisMetadata, columnRow.lookupTable)
+            if lookupTable is None:
+                return None, f'Table "{columnRow.lookupTable}" not in database'
+            if columnRow.lookupCodeColumn not in lookupTable.columns:
+                return None, f'No column named "{columnRow.lookupCodeColumn}" in table "{columnRow.lookupTable}" not in database'
+            if columnRow.lookupDescriptionColumn not in lookupTable.columns:
+                return None, f'No column named "{columnRow.lookupDescriptionColumn}" in table "{columnRow.lookupTable}"'
+        column = {}
+        column['column'] = columnRow.column
+        column['columnName'] = columnRow.columnName
+        column['datatype'] = columnRow.datatype
+        if column['datatype'] not in ['string', 'int', 'float', 'numeric', 'decimal', 'date', 'datetime']:
+            return None, f'Invalid datatype "{columnRow.datatype}" for column "{columnRow.column}" in table "{table}" - must be one of "string", "int", "float", "numeric", "decimal", "date", "datetime"'
+        column['isIndexed'] = columnRow.isIndexed
+        column['lookupTable'] = columnRow.lookupTable
+        column['lookupCodeColumn'] = columnRow.lookupCodeColumn
+        column['lookupDescriptionColumn'] = columnRow.lookupDescriptionColumn
+        mineTable['columns'].append(column)
+    return mineTable, None
+
+
+def loadTablesConfig(workbookFile, thisMetadata, oldConfig):
+    '''
+    Load the configuration workbook - it should have one sheet of database table names/worksheet names pairs.
+    Then one sheet per database table of database table configuration.
+    Tables whose configuration is unchanged (same signature) are copied from the old configuration snapshot (if any),
+    the others are checked against the database, reflecting them into thisMetadata.
+    Returns the new mineTables, the new table signatures and None, or None, None and an error message
+    '''
+    oldTables = {}
+    oldSignatures = {}
+    if oldConfig is not None:
+        oldTables = oldConfig.mineTables
+        oldSignatures = oldConfig.tableSignatures
+    wb = load_workbook(workbookFile)
+
+    # Check the 'tables' worksheet
+    if 'tables' not in wb.sheetnames:
+        return None, None, 'No sheet name "tables" in workbook'
+    tables_df = readWorksheet(wb, 'tables')
+    for heading in ['table', 'tableName', 'worksheet', 'maxRecords']:
+        if heading not in tables_df.columns:
+            return None, None, f'Missing "{heading}" heading in "tables" worksheet'
+    mineTables = {}
+    tableSignatures = {}
+    for tableRow in tables_df.itertuples():
+        table = tableRow.table
+        tableName = tableRow.tableName
+        worksheet = tableRow.worksheet
+        maxRecords = tableRow.maxRecords
+        maxExtracts = None
+        if ('maxExtracts' in tables_df.columns) and not pd.isna(tableRow.maxExtracts):
+            maxExtracts = int(tableRow.maxExtracts)
+        maxBytes = None
+        if ('maxBytes' in tables_df.columns) and not pd.isna(tableRow.maxBytes):
+            maxBytes = int(tableRow.maxBytes)
+        # Check that this worksheet exits
+        if worksheet not in wb.sheetnames:
+            return None, None, f'No sheet named "{worksheet}" in workbook'
+        thisTable_df = readWorksheet(wb, worksheet)
+        tableSignatures[table] = repr((tuple(tableRow)[1:], list(thisTable_df.columns), thisTable_df.values.tolist()))
+
+        # Unchanged tables don't need to be checked again
+        if (table in oldTables) and (oldSignatures.get(table) == tableSignatures[table]):
+            mineTables[table] = oldTables[table]
+            for oldTable in [table] + [thisCol['lookupTable'] for thisCol in oldTables[table]['columns'] if thisCol['lookupTable'] is not None]:
+                if oldTable not in thisMetadata.tables:
+                    oldConfig.metadata.tables[oldTable].to_metadata(thisMetadata)
+            continue
+
+        # Check this table exists
+        if reflectTable(thisMetadata, table) is None:
+            return None, None, f'Table "{table}" not in database'
+        mineTable, errorMessage = checkTableConfig(thisMetadata, table, tableName, maxRecords, maxExtracts, maxBytes, thisTable_df, worksheet)
+        if errorMessage is not None:
+            return None, None, errorMessage
+        mineTables[table] = mineTable
+    return mineTables, tableSignatures, None
+
+
+def watchTablesConfig(workbookFile, reloadInterval):
+    '''
+    Watch the configuration workbook and, when it changes, check the new configuration and swap it in
+    If the new configuration is not valid then the current configuration is kept
+    '''
+    lastModified = os.path.getmtime(workbookFile)
+    while True:
+        time.sleep(reloadInterval)
+        try:
+            modified = os.path.getmtime(workbookFile)
+        except OSError:
+            continue
+        if modified == lastModified:
+            continue
+        lastModified = modified
+        logging.info('Configuration workbook %s has changed - reloading', workbookFile)
+        newMetadata = MetaData()
+        try:
+            mineTables, tableSignatures, errorMessage = loadTablesConfig(workbookFile, newMetadata, d.config)
+        except Exception as thisE:
+            errorMessage = f'Failed to load configuration workbook: {thisE}'
+        if errorMessage is not None:
+            logging.error('New configuration rejected - keeping the current configuration: %s', errorMessage)
+            continue
+        d.config = ConfigSnapshot(newMetadata, mineTables, tableSignatures)
+        if d.aggregateCache is not None:
+            d.aggregateCache.clear()
+        logging.info('New configuration loaded')
+
+
+def collectColumnStats(statsInterval):
+    '''
+    Collect the statistics for every configured column, then refresh them every statsInterval seconds
+    '''
+    while True:
+        for thisTable, mineTable in d.config.mineTables.items():
+            try:
+                d.columnStats[thisTable] = tableStatistics(thisTable, mineTable)
+            except Exception as thisE:
+                logging.error('Failed to collect the column statistics for table "%s": %s', thisTable, thisE)
+        logging.info('Column statistics collected')
+        time.sleep(statsInterval)
+
+
+def tableStatistics(thisTable, mineTable):
+    '''
+    Collect the statistics for the configured columns of one table
+    The row counts, minimums and maximums come from the whole table, the distinct values and histograms from a random sample
+    '''
+    columns = mineTable['columns']
+    selectText = 'SELECT count(*) AS rowCount'
+    for i, thisCol in enumerate(columns):
+        selectText += f', count({thisCol["column"]}) AS count{i}, min({thisCol["column"]}) AS min{i}, max({thisCol["column"]}) AS max{i}'
+    selectText += f' FROM {thisTable}'
+    with d.engine.connect() as conn:
+        counts_df = pd.read_sql_query(text(selectText), conn)
+        rowCount = int(counts_df['rowCount'].iloc[0])
+        sample_df = pd.read_sql_query(text(sampleSQL(thisTable, [thisCol['column'] for thisCol in columns], d.statsSample, rowCount)), conn)
+    tableStats = {'rows':rowCount, 'columns':{}}
+    for i, thisCol in enumerate(columns):
+        sample = [statsValue(value, thisCol['datatype']) for value in sample_df.iloc[:, i] if not pd.isna(value)]
+        nullCount = rowCount - int(counts_df[f'count{i}'].iloc[0])
+        minValue = statsValue(counts_df[f'min{i}'].iloc[0], thisCol['datatype'])
+        maxValue = statsValue(counts_df[f'max{i}'].iloc[0], thisCol['datatype'])
+        tableStats['columns'][thisCol['column']] = ColumnStats(rowCount, nullCount, minValue, maxValue, sample, d.statsBuckets)
+    return tableStats
+
+
+def sampleSQL(thisTable, columns, sampleRows, rowCount):
+    '''
+    Build the SQL that reads a random sample of about sampleRows rows from this table
+    The rows are sampled in the same way as a sampled extract (see sampleParts) - an over sized sample, randomly ordered and cut to size
+    '''
+    columnList = ', '.join(columns)
+    if rowCount <= sampleRows:
+        return f'SELECT {columnList} FROM {thisTable}'
+    tableSample, where = sampleParts(thisTable, sampleRows, rowCount)
+    return extractSQL(thisTable, columnList, where, '', '', None, False, tableSample, sampleRows)
+
+
+def statsValue(value, datatype):
+    '''
+    Convert a value from the database into the same form as the values in the SQL 'where' clauses
+    '''
+    if (value is None) or pd.isna(value):
+        return None
+    if datatype in ['int', 'float', 'numeric', 'decimal']:
+        return float(value)
+    if datatype == 'string':
+        return str(value)
+    if isinstance(value, datetime.datetime) and (datatype == 'date'):
+        return value.date().isoformat()
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return testValue(value, datatype)
+
+
 if __name__ == '__main__':
 
     '''
@@ -774,6 +1977,18 @@ if __name__ == '__main__':
     parser.add_argument('-u', '--username', dest='username', help='The user required to access the database')
     parser.add_argument('-p', '--password', dest='password', help='The user password required to access the database')
     parser.add_argument('-d', '--databaseName', dest='databaseName', help='The name of the database')
+    parser.add_argument('-X', '--maxExtracts', dest='maxExtracts', type=int, default=0, help='The maximum number of extracts that can run at the one time (default=0 - no limit)')
+    parser.add_argument('-U', '--maxUserExtracts', dest='maxUserExtracts', type=int, default=0, help='The maximum number of extracts that one user can run at the one time (default=0 - no limit)')
+    parser.add_argument('-Q', '--maxQueued', dest='maxQueued', type=int, default=20, help='The maximum number of extracts that can be waiting to run (default=20)')
+    parser.add_argument('-R', '--reloadInterval', dest='reloadInterval', type=int, default=30, help='How often, in seconds, to check the Excel workbook for changes (default=30, 0=never)')
+    parser.add_argument('-S', '--statsInterval', dest='statsInterval', type=int, default=0, help='How often, in seconds, to refresh the column statistics (default=0 - never collected)')
+    parser.add_argument('-G', '--aggregateAge', dest='aggregateAge', type=int, default=0, help='How long, in seconds, the counts and sums of counted/summed extracts are kept (default=0 - not kept)')
+    parser.add_argument('-K', '--lookupAge', dest='lookupAge', type=int, default=3600, help='How long, in seconds, the codes and descriptions read from a lookup table are kept (default=3600, 0=not kept)')
+    parser.add_argument('-B', '--batchFile', dest='batchFile', help='Run the query specs in this JSON file, rather than running the web site')
+    parser.add_argument('-o', '--outputDir', dest='outputDir', default='.', help='The directory where the batch extracts will be written (default=.)')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=4, help='The number of batch query specs that can use the database at the one time (default=4)')
+    parser.add_argument('-P', '--profileKey', dest='profileKey', help='Enable on demand profiling of requests that carry this key')
+    parser.add_argument('-W', '--maxWait', dest='maxWait', type=int, default=60, help='The maximum number of seconds that an extract can wait to run (default=60)')
     parser.add_argument ('-v', '--verbose', dest='verbose', type=int, choices=range(0,5), help='The level of logging\n\t0=CRITICAL,1=ERROR,2=WARNING,3=INFO,4=DEBUG')
     parser.add_argument ('-L', '--logDir', dest='logDir', default='.', metavar='logDir', help='The name of the directory where the logging file will be created')
     parser.add_argument ('-l', '--logFile', dest='logFile', metavar='logfile', help='The name of a logging file')
@@ -790,6 +2005,18 @@ if __name__ == '__main__':
     username = args.username
     password = args.password
     databaseName = args.databaseName
+    maxExtracts = args.maxExtracts
+    maxUserExtracts = args.maxUserExtracts
+    maxQueued = args.maxQueued
+    maxWait = args.maxWait
+    reloadInterval = args.reloadInterval
+    statsInterval = args.statsInterval
+    aggregateAge = args.aggregateAge
+    lookupAge = args.lookupAge
+    batchFile = args.batchFile
+    outputDir = args.outputDir
+    jobs = args.jobs
+    profileKey = args.profileKey
     logDir = args.logDir
     logFile = args.logFile
     loggingLevel = args.verbose
@@ -798,14 +2025,14 @@ if __name__ == '__main__':
     logging_levels = {0:logging.CRITICAL, 1:logging.ERROR, 2:logging.WARNING, 3:logging.INFO, 4:logging.DEBUG}
     logfmt = progName + ' [%(asctime)s]: %(message)s'
     if loggingLevel is not None:    # Change the logging level from "WARN" if the -v vebose option is specified
-        if logFile is not None:        # and send it to a file if the -o logfile option is specified
+        if logFile is not None:        # and send it to a file if the -l logfile option is specified
             with open(os.path.join(logDir, logFile), 'wt', encoding='utf-8', newline='') as logOutput:
                 pass
             logging.basicConfig(format=logfmt, datefmt='%d/%m/%y %H:%M:%S %p', level=logging_levels[loggingLevel], filename=os.path.join(logDir, logFile))
         else:
             logging.basicConfig(format=logfmt, datefmt='%d/%m/%y %H:%M:%S %p', level=logging_levels[loggingLevel])
     else:
-        if logFile is not None:        # send the default (WARN) logging to a file if the -o logfile option is specified
+        if logFile is not None:        # send the default (WARN) logging to a file if the -l logfile option is specified
             with open(os.path.join(logDir, logFile), 'wt', encoding='utf-8', newline='') as logOutput:
                 pass
             logging.basicConfig(format=logfmt, datefmt='%d/%m/%y %H:%M:%S %p', filename=os.path.join(logDir, logFile))
@@ -866,11 +2093,14 @@ if __name__ == '__main__':
         sys.exit(d.EX_USAGE)
     connectionString = connectionString.format(username=username, password=password, server=server, databaseName=databaseName)
 
-    # Create the engine
+    # Create the engine - in batch mode the connection pool is limited to the number of jobs
+    poolArgs = {}
+    if batchFile is not None:
+        poolArgs = {'pool_size':jobs, 'max_overflow':0}
     if DatabaseType == 'MSSQL':
-        d.engine = create_engine(connectionString, use_setinputsizes=False, echo=False)
+        d.engine = create_engine(connectionString, use_setinputsizes=False, echo=False, **poolArgs)
     else:
-        d.engine = create_engine(connectionString, echo=False)
+        d.engine = create_engine(connectionString, echo=False, **poolArgs)
 
     # Check if the database exists
     if not database_exists(d.engine.url):
@@ -892,125 +2122,63 @@ if __name__ == '__main__':
     conn.close()
 
     # Now get the metadata and build a session maker
-    d.metadata = MetaData()
-    d.metadata.reflect(bind=d.engine, views=True)
+    metadata = MetaData()
+    metadata.reflect(bind=d.engine, views=True)
     d.Session = sessionmaker(bind=d.engine)
 
+    # Create the extract limiter
+    d.extractLimiter = ExtractLimiter(maxExtracts, maxUserExtracts, maxQueued, maxWait)
 
-    # Load the configuration workbook
-    wb = load_workbook(os.path.join(inputDir, inputWorkbook))
 
-    # Check the 'tables' worksheet
-    if 'tables' not in wb.sheetnames:
-        logging.critical('No sheet name "tables" in workbook')
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    ws = wb['tables']
-    data = ws.values
-    cols = next(data)
-    tables_df = pd.DataFrame(list(data), columns=cols)
-    if 'table' not in tables_df.columns:
-        logging.critical('Missing "table" heading in "tables" worksheet')
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    if 'tableName' not in tables_df.columns:
-        logging.critical('Missing "tableName" heading in "tables" worksheet')
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    if 'worksheet' not in tables_df.columns:
-        logging.critical('Missing "worksheet" heading in "tables" worksheet')
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    if 'maxRecords' not in tables_df.columns:
-        logging.critical('Missing "maxRecords" heading in "tables" worksheet')
+    # Load the configuration workbook
+    workbookFile = os.path.join(inputDir, inputWorkbook)
+    mineTables, tableSignatures, errorMessage = loadTablesConfig(workbookFile, metadata, None)
+    if errorMessage is not None:
+        logging.critical(errorMessage)
         logging.shutdown()
         sys.exit(d.EX_CONFIG)
-    tables = {}
-    for tableRow in tables_df.itertuples():
-        table = tableRow.table
-        tableName = tableRow.tableName
-        worksheet = tableRow.worksheet
-        maxRecords = tableRow.maxRecords
-        # Check this table exists
-        if table not in d.metadata.tables:
-            logging.critical('Table "%s" not in database', table)
-            logging.shutdown()
-            sys.exit(d.EX_CONFIG)
-        # Check that this worksheet exits
-        if worksheet not in wb.sheetnames:
-            logging.critical('No sheet named "%s" in workbook', worksheet)
-            logging.shutdown()
-            sys.exit(d.EX_CONFIG)
-
-        # Check this worksheet
-        ws = wb[worksheet]
-        data = ws.values
-        cols = next(data)
-        thisTable_df = pd.DataFrame(list(data), columns=cols)
-        if 'column' not in thisTable_df.columns:
-            logging.critical('Missing "column" heading in "%s" worksheet', worksheet)
-            logging.shutdown()
-            sys.exit(d.EX_CONFIG)
-        if 'columnName' not in thisTable_df.columns:
-            logging.critical('Missing "columnName" heading in "%s" worksheet', worksheet)
-            logging.shutdown()
-            sys.exit(d.EX_CONFIG)
-        if 'datatype' not in thisTable_df.columns:
-            logging.critical('Missing "datatype" heading in "%s" worksheet', worksheet)
-            logging.shutdown()
-            sys.exit(d.EX_CONFIG)
-        if 'isIndexed' not in thisTable_df.columns:
-            logging.critical('Missing "isIndexed" heading in "%s" worksheet', worksheet)
-            logging.shutdown()
-            sys.exit(d.EX_CONFIG)
-        if 'lookupTable' not in thisTable_df.columns:
-            logging.critical('Missing "lookupTable" heading in "%s" worksheet', worksheet)
-            logging.shutdown()
-            sys.exit(d.EX_CONFIG)
-        if 'lookupCodeColumn' not in thisTable_df.columns:
-            logging.critical('Missing "lookupCodeColumn" heading in "%s" worksheet', worksheet)
-            logging.shutdown()
-            sys.exit(d.EX_CONFIG)
-        if 'lookupDescriptionColumn' not in thisTable_df.columns:
-            logging.critical('Missing "lookupDescriptionColumn" heading in "%s" worksheet', worksheet)
+    d.config = ConfigSnapshot(metadata, mineTables, tableSignatures)
+
+    # Keep the counts and sums of counted/summed extracts, if requested
+    if aggregateAge > 0:
+        d.aggregateCache = AggregateCache(aggregateAge, d.aggregateEntries, d.aggregateRows)
+    d.lookupAge = lookupAge
+
+    # Run the batch of query specs, rather than the web site, if requested
+    if batchFile is not None:
+        try:
+            with open(batchFile, 'rt', encoding='utf-8') as batchSource:
+                specs = json.load(batchSource)
+        except (IOError, ValueError) as thisE:
+            logging.critical('batchFile (%s) failed to load:%s', batchFile, thisE)
             logging.shutdown()
-            sys.exit(d.EX_CONFIG)
-
-        d.mineTables[table] = {}
-        d.mineTables[table]['tableName'] = tableName
-        d.mineTables[table]['maxRecords'] = maxRecords
-        d.mineTables[table]['columns'] = []
-        for columnRow in thisTable_df.itertuples():
-            if columnRow.column not in d.metadata.tables[table].columns:
-                logging.critical('No column named "%s" in table "%s" not in database', columnRow.column, table)
-                logging.shutdown()
-                sys.exit(d.EX_CONFIG)
-            if columnRow.lookupTable is not None:
-                if columnRow.lookupTable not in d.metadata.tables:
-                    logging.critical('Table "%s" not in database', columnRow.lookupTable)
-                    logging.shutdown()
-                    sys.exit(d.EX_CONFIG)
-                if columnRow.lookupCodeColumn not in d.metadata.tables[columnRow.lookupTable].columns:
-                    logging.critical('No column named "%s" in table "%s" not in database', columnRow.lookupCodeColumn, columnRow.lookupTable)
-                    logging.shutdown()
-                    sys.exit(d.EX_CONFIG)
-                if columnRow.lookupDescriptionColumn not in d.metadata.tables[columnRow.lookupTable].columns:
-                    logging.critical('No column named "%s" in table "%s"', columnRow.lookupDescriptionColumn, columnRow.lookupTable)
-                    logging.shutdown()
-                    sys.exit(d.EX_CONFIG)
-            column = {}
-            column['column'] = columnRow.column
-            column['columnName'] = columnRow.columnName
-            column['datatype'] = columnRow.datatype
-            if column['datatype'] not in ['string', 'int', 'float', 'numeric', 'decimal', 'date', 'datetime']:
-                logging.critical('Invalid datatype "%s" for column "%s" in table "%s"', columnRow.datatype, columnRow.column, table)
-                logging.critical('Must be one of "string", "int", "float", "numeric", "decimal", "date", "datetime", "time"')
-                logging.shutdown()
-                sys.exit(d.EX_CONFIG)
-            column['isIndexed'] = columnRow.isIndexed
-            column['lookupTable'] = columnRow.lookupTable
-            column['lookupCodeColumn'] = columnRow.lookupCodeColumn
-            column['lookupDescriptionColumn'] = columnRow.lookupDescriptionColumn
-            d.mineTables[table]['columns'].append(column)
+            sys.exit(d.EX_NOINPUT)
+        os.makedirs(outputDir, exist_ok=True)
+        batchStart = time.monotonic()
+        summary = runBatch(specs, outputDir, jobs)
+        print(f'{"Query":30} {"Status":50} {"Rows":>10} {"Seconds":>10}')
+        for name, status, rows, seconds in summary:
+            print(f'{name:30} {status:50} {rows:>10} {seconds:>10.2f}')
+        print(f'{len(summary)} queries in {time.monotonic() - batchStart:.2f} seconds, {sum(1 for thisSummary in summary if thisSummary[1] == "OK")} succeeded')
+        logging.shutdown()
+        if all(thisSummary[1] == 'OK' for thisSummary in summary):
+            sys.exit(d.EX_OK)
+        sys.exit(d.EX_WARN)
+
+    # Enable on demand profiling - the hooks are only registered if profiling is enabled
+    if profileKey is not None:
+        d.profileKey = profileKey
+        d.profileDir = os.path.join(logDir, 'profiles')
+        os.makedirs(d.profileDir, exist_ok=True)
+        app.before_request(startProfile)
+        app.after_request(stopProfile)
+
+    # Watch the configuration workbook for changes
+    if reloadInterval > 0:
+        threading.Thread(target=watchTablesConfig, args=(workbookFile, reloadInterval), daemon=True).start()
+
+    # Collect the column statistics in the background
+    if statsInterval > 0:
+        threading.Thread(target=collectColumnStats, args=(statsInterval,), daemon=True).start()
 
     app.run(host="0.0.0.0")
@@ -0,0 +1,135 @@
+'''
+Admission control for the Simple Data Miner extracts.
+
+Extracts are limited globally, per table and per user.
+Extracts that cannot run straight away wait in a bounded queue and are admitted fairly -
+the waiting extract belonging to the user with the fewest running extracts goes next,
+with ties going to the extract that has been waiting the longest.
+An extract that is still waiting after a short poll keeps its place in the queue, so that the user can be shown
+their place in the queue and the same extract can come back for it. While it is away, the extracts that are
+actually waiting can run ahead of it. Places that aren't come back for are given up.
+'''
+
+# pylint: disable=invalid-name, line-too-long
+
+import threading
+import time
+import itertools
+import collections
+import logging
+
+
+class ExtractLimiter:
+    '''
+    Limit the number of extracts running against the database at the one time
+    '''
+
+    def __init__(self, maxExtracts, maxUserExtracts, maxQueued, maxWait, pollWait=10, keepPlace=30):
+        self.maxExtracts = maxExtracts              # The global limit (0 means no limit)
+        self.maxUserExtracts = maxUserExtracts      # The per user limit (0 means no limit)
+        self.maxQueued = maxQueued                  # The maximum number of extracts that can be waiting
+        self.maxWait = maxWait                      # The maximum number of seconds an extract can wait
+        self.pollWait = pollWait                    # The number of seconds an extract with a key waits before its place in the queue is reported
+        self.keepPlace = keepPlace                  # The number of seconds a place in the queue is kept for an extract to come back for it
+        self.cond = threading.Condition()
+        self.running = 0
+        self.runningTables = collections.Counter()
+        self.runningUsers = collections.Counter()
+        self.waiting = []                           # The waiting extracts, in order of arrival, as (ticket, table, user, tableLimit)
+        self.tickets = itertools.count()
+        self.places = {}                            # The places kept in the queue, by key, as [waiter, deadline, time last reported (None while polling)]
+
+    def canRun(self, table, user, tableLimit):
+        '''
+        Check if an extract from this table, for this user, can run without exceeding any limit
+        '''
+        if (self.maxExtracts > 0) and (self.running >= self.maxExtracts):
+            return False
+        if (tableLimit is not None) and (self.runningTables[table] >= tableLimit):
+            return False
+        if (self.maxUserExtracts > 0) and (self.runningUsers[user] >= self.maxUserExtracts):
+            return False
+        return True
+
+    def nextWaiter(self):
+        '''
+        Return the waiting extract that should run next, or None if none of the waiting extracts can run
+        Only extracts that are actually waiting can run - a place kept in the queue has to be come back for first
+        '''
+        now = time.monotonic()
+        away = set()
+        for key, (waiter, deadline, reported) in list(self.places.items()):
+            if reported is None:
+                continue
+            if now - reported > self.keepPlace:
+                logging.info('Extract from table "%s" for user "%s" gave up its place in the queue', waiter[1], waiter[2])
+                self.waiting.remove(waiter)
+                del self.places[key]
+            else:
+                away.add(waiter)
+        nextOne = None
+        for waiter in self.waiting:
+            if (waiter in away) or not self.canRun(waiter[1], waiter[2], waiter[3]):
+                continue
+            if (nextOne is None) or (self.runningUsers[waiter[2]] < self.runningUsers[nextOne[2]]):
+                nextOne = waiter
+        return nextOne
+
+    def acquire(self, table, user, tableLimit, key=None):
+        '''
+        Wait until this extract can run
+        An extract with a key waits for at most pollWait seconds at a time, keeping its place in the queue in between
+        Returns (None, None) if the extract can run, (None, position) if the extract with this key is still waiting,
+        otherwise (message, None) where the message explains why the extract was rejected
+        '''
+        with self.cond:
+            if (key in self.places) and (self.places[key][2] is None):     # The same extract is already waiting (e.g. asked for twice)
+                key = None
+            if key in self.places:
+                waiter, deadline = self.places[key][:2]
+                self.places[key][2] = None
+            else:
+                waiter = (next(self.tickets), table, user, tableLimit)
+                deadline = time.monotonic() + self.maxWait
+                self.waiting.append(waiter)
+                if self.nextWaiter() is not waiter:
+                    if len(self.waiting) > self.maxQueued:
+                        self.waiting.remove(waiter)
+                        return f'The database is busy - there are already {self.maxQueued} extracts waiting to run', None
+                    logging.info('Extract from table "%s" for user "%s" queued at position %d', table, user, self.waiting.index(waiter) + 1)
+                    if key is not None:
+                        self.places[key] = [waiter, deadline, None]
+            pollDeadline = time.monotonic() + self.pollWait
+            while self.nextWaiter() is not waiter:
+                now = time.monotonic()
+                if now >= deadline:
+                    position = self.waiting.index(waiter) + 1
+                    self.waiting.remove(waiter)
+                    self.places.pop(key, None)
+                    self.cond.notify_all()
+                    return f'The database is busy - your extract was still at position {position} in the queue after waiting {self.maxWait} seconds', None
+                if (key is not None) and (now >= pollDeadline):
+                    self.places[key][2] = now
+                    self.cond.notify_all()          # While it is away, the extracts behind it can run
+                    return None, self.waiting.index(waiter) + 1
+                wakeUp = min(deadline, now + 1.0)       # Wake up regularly to give up abandoned places
+                if key is not None:
+                    wakeUp = min(wakeUp, pollDeadline)
+                self.cond.wait(wakeUp - now)
+            self.waiting.remove(waiter)
+            self.places.pop(key, None)
+            self.running += 1
+            self.runningTables[table] += 1
+            self.runningUsers[user] += 1
+            self.cond.notify_all()
+            return None, None
+
+    def release(self, table, user):
+        '''
+        This extract has finished, so let the next waiting extract run
+        '''
+        with self.cond:
+            self.running -= 1
+            self.runningTables[table] -= 1
+            self.runningUsers[user] -= 1
+            self.cond.notify_all()
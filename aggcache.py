@@ -0,0 +1,216 @@
+'''
+Materialized aggregates for the Simple Data Miner.
+
+Aggregated (GROUP BY) extracts are run at a finer grain - grouped by the extract's grouping columns plus any whole number columns
+constrained to a list of values ("in" or "=") - and the per group partial counts and sums are kept.
+Only whole number columns are used, as only their values compare the same in Python as in the database -
+string comparisons depend upon the collation (case, trailing spaces), and dates and decimals come back as different types.
+Lists of values for other columns are left with the other constraints.
+A later extract from the same table, with the same other constraints, can then be answered without touching the database,
+by filtering and re-summing the partial counts and sums, if
+    its grouping columns are amongst the materialized grouping columns,
+    its counts and sums are amongst the materialized counts and sums, and
+    its lists of values are the same as, or a subset of, the materialized lists of values.
+'''
+
+# pylint: disable=invalid-name, line-too-long
+
+import re
+import time
+import threading
+import collections
+import pandas as pd
+from columnstats import TOKENS
+
+
+AGGREGATE = re.compile(r'^(count|sum)\((\w+)\)$')
+INTEGER = re.compile(r'^-?\d+$')
+
+
+class AggregateQuery:
+    '''
+    One aggregated extract, split into the parts that decide whether it can be answered from materialized aggregates
+    '''
+
+    def __init__(self, thisTable, selectColumns, where, groupByColumns, datatypes):
+        self.table = thisTable
+        self.outputColumns = selectColumns.split(', ')
+        self.groupBy = groupByColumns.split(', ')
+        self.aggregates = []                    # The (function, column) of each count and sum
+        for column in self.outputColumns:
+            if (aggregate := AGGREGATE.match(column)) is not None:
+                self.aggregates.append((aggregate.group(1), aggregate.group(2)))
+            elif column not in self.groupBy:
+                raise ValueError(f'Cannot materialize "{column}"')
+        self.inLists = {}                       # The list of values for each column constrained to a list of values
+        residual = []                           # The other constraints
+        for clause in splitClauses(where):
+            inList = listConstraint(clause)
+            if (inList is None) or (datatypes.get(inList[0]) != 'int') or (inList[0] in self.inLists) or not all(isinstance(value, int) and (abs(value) < 2**63) for value in inList[1]):
+                residual.append(clause)
+            else:
+                self.inLists[inList[0]] = inList[1]
+        self.residual = ' AND '.join(sorted(residual))
+        self.grain = list(self.groupBy)
+        for column in self.inLists:
+            if column not in self.grain:
+                self.grain.append(column)
+
+    def resum(self, partial_df):
+        '''
+        Answer this extract from materialized partial counts and sums, which may include values that aren't in this extract's lists
+        '''
+        for column, values in self.inLists.items():
+            partial_df = partial_df[partial_df[column].isin(pd.Series(list(values), dtype=partial_df[column].dtype))]
+        return self.regroup(partial_df)
+
+    def regroup(self, partial_df):
+        '''
+        Answer this extract from partial counts and sums that only include the values in this extract's lists
+        '''
+        sums = [f'{function}({column})' for function, column in self.aggregates]
+        extract_df = partial_df.groupby(self.groupBy, dropna=False, as_index=False)[sums].sum(min_count=1)     # A sum of only NULLs is NULL
+        return extract_df[self.outputColumns]
+
+
+class AggregateCache:
+    '''
+    The materialized aggregates, least recently used first
+    '''
+
+    def __init__(self, maxAge, maxEntries, maxRows):
+        self.maxAge = maxAge                    # The number of seconds materialized aggregates are kept
+        self.maxEntries = maxEntries            # The maximum number of materialized aggregates
+        self.maxRows = maxRows                  # The maximum number of groups in one materialized aggregate
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()    # (table, residual constraints) -> list of (query, partial_df, materialized time)
+
+    def find(self, query):
+        '''
+        Return the materialized partial counts and sums that can answer this extract, or None if there aren't any
+        '''
+        now = time.monotonic()
+        key = (query.table, query.residual)
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries[key] = [entry for entry in self.entries[key] if now - entry[2] < self.maxAge]
+            for cached, partial_df, materialized in self.entries[key]:
+                if not set(query.grain) <= set(cached.grain):
+                    continue
+                if not set(query.aggregates) <= set(cached.aggregates):
+                    continue
+                if any((column not in query.inLists) or (not query.inLists[column] <= values) for column, values in cached.inLists.items()):
+                    continue
+                self.entries.move_to_end(key)
+                return partial_df
+        return None
+
+    def add(self, query, partial_df):
+        '''
+        Keep these partial counts and sums, unless there are too many groups
+        '''
+        if len(partial_df) > self.maxRows:
+            return
+        key = (query.table, query.residual)
+        with self.lock:
+            self.entries.setdefault(key, []).append((query, partial_df, time.monotonic()))
+            self.entries.move_to_end(key)
+            while sum(len(entries) for entries in self.entries.values()) > self.maxEntries:
+                oldest = next(iter(self.entries))
+                self.entries[oldest].pop(0)
+                if len(self.entries[oldest]) == 0:
+                    del self.entries[oldest]
+
+    def clear(self):
+        '''
+        Forget all the materialized aggregates
+        '''
+        with self.lock:
+            self.entries.clear()
+
+
+def splitClauses(where):
+    '''
+    Split an SQL 'where' clause, as built by the Simple Data Miner, into the constraints that are AND'ed together
+    '''
+    clauses = []
+    if (where is None) or (where.strip() == ''):
+        return clauses
+    depth = 0
+    inString = False
+    start = 0
+    i = 0
+    while i < len(where):
+        char = where[i]
+        if char == '"':
+            inString = not inString
+        elif not inString:
+            if char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+            elif (depth == 0) and where.startswith(' AND ', i):
+                clauses.append(where[start:i].strip())
+                start = i + 5
+                i = start
+                continue
+        i += 1
+    clauses.append(where[start:].strip())
+    return clauses
+
+
+def listConstraint(clause):
+    '''
+    If this constraint restricts a column to a list of values ("=", "in", or "in" lists OR'ed together)
+    then return the column and the set of values, otherwise None
+    '''
+    tokens = []
+    pos = 0
+    while pos < len(clause):
+        token = TOKENS.match(clause, pos)
+        if (token is None) or (token.end() == pos):
+            return None
+        pos = token.end()
+        kind = token.lastgroup
+        if kind == 'string':
+            tokens.append(('value', token.group(kind)[1:-1]))
+        elif kind == 'number':
+            number = token.group(kind)
+            if INTEGER.match(number):
+                tokens.append(('value', int(number)))
+            else:
+                tokens.append(('value', float(number)))
+        elif (kind == 'word') and (token.group(kind).lower() in ['in', 'or']):
+            tokens.append(('keyword', token.group(kind).lower()))
+        else:
+            tokens.append((kind, token.group(kind)))
+    if (len(tokens) == 3) and (tokens[0][0] == 'word') and (tokens[1] == ('op', '=')) and (tokens[2][0] == 'value'):
+        return tokens[0][1], {tokens[2][1]}
+    if (len(tokens) > 2) and (tokens[0] == ('op', '(')) and (tokens[-1] == ('op', ')')):
+        tokens = tokens[1:-1]
+    column = None
+    values = set()
+    i = 0
+    while i < len(tokens):
+        if (i + 3 >= len(tokens)) or (tokens[i][0] != 'word') or (tokens[i + 1] != ('keyword', 'in')) or (tokens[i + 2] != ('op', '(')):
+            return None
+        if (column is not None) and (tokens[i][1] != column):
+            return None
+        column = tokens[i][1]
+        i += 3
+        while (i < len(tokens)) and (tokens[i][0] == 'value'):
+            values.add(tokens[i][1])
+            i += 1
+            if (i < len(tokens)) and (tokens[i] == ('op', ',')):
+                i += 1
+        if (i >= len(tokens)) or (tokens[i] != ('op', ')')):
+            return None
+        i += 1
+        if i < len(tokens):
+            if tokens[i] != ('keyword', 'or'):
+                return None
+            i += 1
+    if column is None:
+        return None
+    return column, values
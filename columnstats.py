@@ -0,0 +1,301 @@
+'''
+Column statistics for the Simple Data Miner.
+
+For each configured column a background collector records the minimum and maximum values, the fraction of empty (NULL) values,
+an approximate number of distinct values and an equi-depth histogram, built from the whole table (counts, minimum and maximum)
+and a random sample of its rows (distinct values and histogram).
+The statistics are used to estimate how many records a set of constraints would match,
+without running a count(*) query against the database, and to bound how many they could match.
+'''
+
+# pylint: disable=invalid-name, line-too-long
+
+import re
+import math
+import bisect
+import collections
+
+
+class ColumnStats:
+    '''
+    The statistics for one column
+    '''
+
+    def __init__(self, rowCount, nullCount, minValue, maxValue, sample, buckets):
+        self.rowCount = rowCount
+        self.nullFraction = 0.0
+        if rowCount > 0:
+            self.nullFraction = nullCount / rowCount
+        self.minValue = minValue
+        self.maxValue = maxValue
+        values = sorted(sample)                     # The non NULL values in the sample of rows
+        self.sampleSize = len(values)
+        self.frequencies = collections.Counter(values)
+        self.distinct = estimateDistinct(self.frequencies, self.sampleSize, rowCount - nullCount)
+        self.histogram = []                         # The bucket boundaries, with the same number of sampled values in each bucket
+        if self.sampleSize > 0:
+            buckets = min(buckets, self.sampleSize)
+            self.histogram = [values[round(i * (self.sampleSize - 1) / buckets)] for i in range(buckets + 1)]
+
+    def equals(self, value):
+        '''
+        The fraction of rows where this column equals value
+        '''
+        if self.sampleSize == 0:
+            return 0.0
+        if value in self.frequencies:
+            return (1.0 - self.nullFraction) * self.frequencies[value] / self.sampleSize
+        if self.sampleSize >= self.rowCount * (1.0 - self.nullFraction):     # Every row was sampled
+            return 0.0
+        return (1.0 - self.nullFraction) / max(self.distinct, 1)
+
+    def below(self, value, inclusive):
+        '''
+        The fraction of rows where this column is less than (or equal to, if inclusive) value
+        '''
+        if len(self.histogram) == 0:
+            return 0.0
+        bounds = self.histogram
+        if inclusive:
+            i = bisect.bisect_right(bounds, value)
+        else:
+            i = bisect.bisect_left(bounds, value)
+        if i == 0:
+            return 0.0
+        if i == len(bounds):
+            return 1.0 - self.nullFraction
+        within = 0.5
+        low = bounds[i - 1]
+        high = bounds[i]
+        if isinstance(value, float) and (high != low):
+            within = (value - low) / (high - low)
+        return (1.0 - self.nullFraction) * (i - 1 + within) / (len(bounds) - 1)
+
+    def like(self, pattern):
+        '''
+        The fraction of rows where this column matches the SQL "like" pattern (case insensitive, as most collations are)
+        '''
+        if self.sampleSize == 0:
+            return 0.0
+        regex = re.compile(''.join('.*' if char == '%' else '.' if char == '_' else re.escape(char) for char in pattern), re.IGNORECASE | re.DOTALL)
+        matched = sum(count for value, count in self.frequencies.items() if regex.fullmatch(str(value)))
+        return (1.0 - self.nullFraction) * matched / self.sampleSize
+
+    def selectivity(self, relop, value):
+        '''
+        The fraction of rows that match this column compared to value (a list of values for "in")
+        '''
+        if relop == '=':
+            return self.equals(value)
+        if relop == '!=':
+            return max(0.0, 1.0 - self.nullFraction - self.equals(value))
+        if relop == '<':
+            return self.below(value, False)
+        if relop == '<=':
+            return self.below(value, True)
+        if relop == '>':
+            return max(0.0, 1.0 - self.nullFraction - self.below(value, True))
+        if relop == '>=':
+            return max(0.0, 1.0 - self.nullFraction - self.below(value, False))
+        if relop == 'like':
+            return self.like(value)
+        if relop == 'not like':
+            return max(0.0, 1.0 - self.nullFraction - self.like(value))
+        if relop == 'in':
+            return min(1.0 - self.nullFraction, sum(self.equals(thisValue) for thisValue in set(value)))
+        return None
+
+    def bounds(self, relop, value):
+        '''
+        The lower and upper bounds on the fraction of rows that match this column compared to value
+        The bounds allow for four standard errors of a fraction measured from the sample (none if every row was sampled),
+        plus a bucket's share of the rows for comparisons that use the histogram
+        '''
+        fraction = self.selectivity(relop, value)
+        if fraction is None:
+            return None
+        margin = 0.0
+        if self.sampleSize == 0:
+            margin = 1.0
+        elif self.sampleSize < self.rowCount * (1.0 - self.nullFraction):
+            margin = 2.0 / math.sqrt(self.sampleSize)
+        if relop in ['<', '<=', '>', '>=']:
+            margin += 1.0 / max(len(self.histogram) - 1, 1)
+        margin *= 1.0 - self.nullFraction
+        return max(0.0, fraction - margin), min(1.0 - self.nullFraction, fraction + margin)
+
+
+def estimateDistinct(frequencies, sampleSize, nonNullRows):
+    '''
+    Estimate the number of distinct values in the whole column from the sample (the GEE estimator)
+    Values seen once in the sample are scaled up, values seen more than once are assumed to have been seen already
+    '''
+    if sampleSize == 0:
+        return 0
+    once = sum(1 for count in frequencies.values() if count == 1)
+    distinct = math.sqrt(max(nonNullRows, sampleSize) / sampleSize) * once + len(frequencies) - once
+    return int(min(max(distinct, len(frequencies)), nonNullRows))
+
+
+# The tokens in the SQL 'where' clauses built by the Simple Data Miner
+TOKENS = re.compile(r'\s*(?:(?P<string>"[^"]*")|(?P<number>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)|(?P<op>>=|<=|!=|=|<|>|\(|\)|,)|(?P<word>[A-Za-z_][A-Za-z_0-9.]*))')
+
+
+class WhereEstimator:
+    '''
+    Estimate the fraction of rows matched by an SQL 'where' clause, as built by the Simple Data Miner
+    Constraints joined by AND are assumed to be independent; constraints joined by OR are assumed to overlap independently
+    The bounds make no such assumptions - constraints joined by AND match no more rows than the most selective of them,
+    and no fewer than the rows that none of them can have missed; constraints joined by OR match no more rows than all of them
+    added together, and no fewer than the least selective of them
+    '''
+
+    def __init__(self, where, tableStats):
+        self.tableStats = tableStats        # The ColumnStats for each column in the table
+        self.mode = 'estimate'              # 'estimate', or the 'lower' or 'upper' bound
+        self.tokens = []
+        pos = 0
+        where = where.rstrip()
+        while pos < len(where):
+            token = TOKENS.match(where, pos)
+            if (token is None) or (token.end() == pos):
+                raise ValueError(f'Cannot parse where clause at "{where[pos:pos + 20]}"')
+            pos = token.end()
+            kind = token.lastgroup
+            thisToken = token.group(kind)
+            if kind == 'string':
+                self.tokens.append(('value', thisToken[1:-1]))
+            elif kind == 'number':
+                self.tokens.append(('value', float(thisToken)))
+            elif (kind == 'word') and (thisToken.upper() in ['AND', 'OR', 'NOT', 'LIKE', 'IN']):
+                self.tokens.append(('keyword', thisToken.upper()))
+            else:
+                self.tokens.append((kind, thisToken))
+        self.pos = 0
+
+    def peek(self):
+        '''
+        The next token (or None at the end)
+        '''
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def take(self, kind, thisToken=None):
+        '''
+        Consume the next token, which must be of this kind (and have this value)
+        '''
+        nextToken = self.peek()
+        if (nextToken is None) or (nextToken[0] != kind) or ((thisToken is not None) and (nextToken[1] != thisToken)):
+            raise ValueError(f'Expected {thisToken or kind}, found {nextToken}')
+        self.pos += 1
+        return nextToken[1]
+
+    def estimate(self):
+        '''
+        The estimated fraction of rows matched by the whole where clause
+        '''
+        return self.whole('estimate')
+
+    def bounds(self):
+        '''
+        The lower and upper bounds on the fraction of rows matched by the whole where clause
+        '''
+        return self.whole('lower'), self.whole('upper')
+
+    def whole(self, mode):
+        '''
+        Parse the whole where clause, either estimating or bounding the fraction of rows it matches
+        '''
+        self.pos = 0
+        self.mode = mode
+        fraction = self.orTerms()
+        if self.peek() is not None:
+            raise ValueError(f'Unexpected {self.peek()}')
+        return fraction
+
+    def orTerms(self):
+        '''
+        term OR term ...
+        '''
+        if self.mode == 'lower':
+            fraction = self.andTerms()
+            while self.peek() == ('keyword', 'OR'):
+                self.take('keyword', 'OR')
+                fraction = max(fraction, self.andTerms())
+            return fraction
+        if self.mode == 'upper':
+            fraction = self.andTerms()
+            while self.peek() == ('keyword', 'OR'):
+                self.take('keyword', 'OR')
+                fraction += self.andTerms()
+            return min(1.0, fraction)
+        missed = 1.0 - self.andTerms()
+        while self.peek() == ('keyword', 'OR'):
+            self.take('keyword', 'OR')
+            missed *= 1.0 - self.andTerms()
+        return 1.0 - missed
+
+    def andTerms(self):
+        '''
+        constraint AND constraint ...
+        '''
+        fraction = self.constraint()
+        while self.peek() == ('keyword', 'AND'):
+            self.take('keyword', 'AND')
+            if self.mode == 'lower':
+                fraction = max(0.0, fraction + self.constraint() - 1.0)
+            elif self.mode == 'upper':
+                fraction = min(fraction, self.constraint())
+            else:
+                fraction *= self.constraint()
+        return fraction
+
+    def constraint(self):
+        '''
+        (where) | column relop value | column [not] like value | column in (value, ...)
+        '''
+        if self.peek() == ('op', '('):
+            self.take('op', '(')
+            fraction = self.orTerms()
+            self.take('op', ')')
+            return fraction
+        column = self.take('word')
+        if column not in self.tableStats:
+            raise ValueError(f'No statistics for column {column}')
+        nextToken = self.peek()
+        if nextToken == ('keyword', 'NOT'):
+            self.take('keyword', 'NOT')
+            self.take('keyword', 'LIKE')
+            relop = 'not like'
+            value = self.take('value')
+        elif nextToken == ('keyword', 'LIKE'):
+            self.take('keyword', 'LIKE')
+            relop = 'like'
+            value = self.take('value')
+        elif nextToken == ('keyword', 'IN'):
+            self.take('keyword', 'IN')
+            self.take('op', '(')
+            relop = 'in'
+            value = [self.take('value')]
+            while self.peek() == ('op', ','):
+                self.take('op', ',')
+                value.append(self.take('value'))
+            self.take('op', ')')
+        else:
+            relop = self.take('op')
+            value = self.take('value')
+        try:
+            if self.mode == 'estimate':
+                fraction = self.tableStats[column].selectivity(relop, value)
+            else:
+                fraction = self.tableStats[column].bounds(relop, value)
+        except TypeError as thisE:      # The value can't be compared with the values in this column
+            raise ValueError(f'Cannot compare {value} with column {column}') from thisE
+        if fraction is None:
+            raise ValueError(f'Unknown operator {relop}')
+        if self.mode == 'lower':
+            return fraction[0]
+        if self.mode == 'upper':
+            return fraction[1]
+        return fraction
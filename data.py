@@ -26,7 +26,19 @@ EX_NOPERM = 77        # permission denied
 EX_CONFIG = 78        # configuration error
 
 
-mineTables = {}     # A dictionary of all the tables that can be mined
+config = None       # The current configuration snapshot (a ConfigSnapshot) - replaced as a whole when the configuration is reloaded
 engine = None       # The database engine
-metadata = None     # The database metadata
 Session = None      # The database session maker
+extractLimiter = None   # The limiter on the number of extracts running at the one time
+inListChunk = 1000   # The maximum number of values in one SQL "in" list
+maxLinkLength = 65000    # The longest download link (werkzeug accepts a 65535 byte request line - lower this behind a proxy with a lower limit)
+streamChunk = 10000  # The number of rows in each chunk of a streamed extract
+profileKey = None   # The key that requests must carry to be profiled
+profileDir = None   # The directory where profiles are written
+lookupAge = 3600   # How long, in seconds, each cached code/description dictionary is kept
+columnStats = {}    # The column statistics for each table, as {'rows':rowCount, 'columns':{column:ColumnStats}}
+statsSample = 10000  # The number of rows sampled when collecting column statistics
+statsBuckets = 20   # The number of buckets in each column histogram
+aggregateCache = None   # The kept counts and sums of counted/summed extracts (if enabled)
+aggregateEntries = 100  # The maximum number of kept sets of counts and sums
+aggregateRows = 100000  # The maximum number of groups in one kept set of counts and sums
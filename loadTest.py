@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+
+# pylint: disable=invalid-name, line-too-long, broad-exception-caught
+
+'''
+A script to load test the Simple Data Miner.
+
+This script builds an embedded (SQLite) test database, shaped by the configuration workbook,
+starts the Simple Data Miner web site against it and then replays complete data mining sessions
+(splash, doSelectColumns, constrainColumns, doNextConstraint, doThisConstraint, setConstraints, doAggregates, doSQL)
+from many concurrent users. At the end it reports the throughput, and the latency percentiles and error rate for each step.
+This is a load test of the whole web site - the unit tests are in the tests directory (python3 -m pytest tests).
+
+    SYNOPSIS
+    $ python3 loadTest.py
+        [-I inputDir|--inputDir=inputDir]
+        [-i inputWorkbook|--inputWorkbook=inputWorkbook]
+        [-t testDatabase|--testDatabase=testDatabase]
+        [-r rows|--rows=rows]
+        [-c concurrency|--concurrency=concurrency]
+        [-n sessions|--sessions=sessions]
+        [-X maxExtracts|--maxExtracts=maxExtracts]
+        [-v loggingLevel|--verbose=logingLevel]
+
+    OPTIONS
+    -I inputDir|--inputDir=inputDir
+    The directory containing the Excel workbook which contains
+    the configuration of the minable tables
+
+    -i inputWorkbook|--inputWorkbook=inputWorkbook
+    The Excel workbook which contains
+    the configuration of the minable tables
+
+    -t testDatabase|--testDatabase=testDatabase
+    The SQLite database file to build (default - a temporary file)
+
+    -r rows|--rows=rows
+    The number of rows in each minable table in the test database (default=10000)
+
+    -c concurrency|--concurrency=concurrency
+    The number of users mining data at the one time (default=10)
+
+    -n sessions|--sessions=sessions
+    The total number of data mining sessions to replay (default=100)
+
+    -X maxExtracts|--maxExtracts=maxExtracts
+    The maximum number of extracts that can run at the one time (default=0 - no limit)
+
+    -v loggingLevel|--verbose=loggingLevel
+    Set the level of logging that you want.
+'''
+
+# Import all the modules that make life easy
+import sys
+import os
+import argparse
+import logging
+import random
+import datetime
+import tempfile
+import threading
+import time
+import statistics
+import collections
+import urllib.request
+import urllib.parse
+import urllib.error
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import MetaData, Table, Column, Index, create_engine, String, Integer, Float, Numeric, Date, DateTime
+from openpyxl import load_workbook
+from werkzeug.serving import make_server
+import data as d
+import SimpleDataMiner as sdm
+from admission import ExtractLimiter
+from snapshot import ConfigSnapshot
+
+
+STEPS = ['splash', 'doSelectColumns', 'constrainColumns', 'doNextConstraint', 'doThisConstraint', 'setConstraints', 'doAggregates', 'doSQL']
+
+
+class FormParser(HTMLParser):
+    '''
+    Collect the hidden form fields and the links from a Simple Data Miner web page, and whether it refreshes itself
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.hidden = {}
+        self.links = []
+        self.refresh = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if (tag == 'meta') and (attrs.get('http-equiv') == 'refresh'):
+            self.refresh = True
+        elif (tag == 'input') and (attrs.get('type') == 'hidden'):
+            self.hidden[attrs.get('name')] = attrs.get('value', '')
+        elif (tag == 'a') and ('href' in attrs):
+            self.links.append(attrs['href'])
+
+
+def buildTestDatabase(engine, workbookFile, rows):
+    '''
+    Build a test database with a table, and any lookup tables, for each minable table in the configuration workbook
+    '''
+    columnTypes = {'string':String(20), 'int':Integer, 'float':Float, 'numeric':Numeric(12, 2), 'decimal':Numeric(12, 2), 'date':Date, 'datetime':DateTime}
+    wb = load_workbook(workbookFile)
+    tables_df = sdm.readWorksheet(wb, 'tables')
+    metadata = MetaData()
+    lookups = {}            # The codes for each lookup table
+    mineTables = []
+    for tableRow in tables_df.itertuples():
+        thisTable_df = sdm.readWorksheet(wb, tableRow.worksheet)
+        columns = []
+        for columnRow in thisTable_df.itertuples():
+            columns.append(Column(columnRow.column, columnTypes[columnRow.datatype]))
+            if (columnRow.lookupTable is not None) and (columnRow.lookupTable not in lookups):
+                Table(columnRow.lookupTable, metadata, Column(columnRow.lookupCodeColumn, String(20)), Column(columnRow.lookupDescriptionColumn, String(60)))
+                lookups[columnRow.lookupTable] = [f'{columnRow.lookupTable[:3].upper()}{code}' for code in range(1, 11)]
+        table = Table(tableRow.table, metadata, *columns)
+        for columnRow in thisTable_df.itertuples():
+            if columnRow.isIndexed == 'Y':
+                Index(f'ix_{tableRow.table}_{columnRow.column}', table.columns[columnRow.column])
+        mineTables.append((table, thisTable_df))
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+    rng = random.Random(0)
+    start = datetime.datetime(2020, 1, 1)
+    with engine.begin() as conn:
+        for lookupTable, codes in lookups.items():
+            table = metadata.tables[lookupTable]
+            codeColumn, descriptionColumn = [column.name for column in table.columns]
+            conn.execute(table.insert(), [{codeColumn:code, descriptionColumn:f'Description of {code}'} for code in codes])
+        for table, thisTable_df in mineTables:
+            data = []
+            for row in range(rows):
+                values = {}
+                for columnRow in thisTable_df.itertuples():
+                    if columnRow.lookupTable is not None:
+                        values[columnRow.column] = rng.choice(lookups[columnRow.lookupTable])
+                    elif columnRow.datatype == 'string':
+                        values[columnRow.column] = f'S{rng.randint(1, 100)}'
+                    elif columnRow.datatype == 'int':
+                        values[columnRow.column] = rng.randint(0, 999)
+                    elif columnRow.datatype in ['float', 'numeric', 'decimal']:
+                        values[columnRow.column] = round(rng.uniform(0, 1000), 2)
+                    elif columnRow.datatype == 'date':
+                        values[columnRow.column] = (start + datetime.timedelta(days=rng.randint(0, 1000))).date()
+                    else:
+                        values[columnRow.column] = start + datetime.timedelta(minutes=rng.randint(0, 1000000))
+                data.append(values)
+            conn.execute(table.insert(), data)
+
+
+def startServer():
+    '''
+    Start the Simple Data Miner web site on a free local port
+    '''
+    server = make_server('127.0.0.1', 0, sdm.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def doStep(step, url, form, timings, errors):
+    '''
+    Make one request of a data mining session, recording how long it took
+    A page that refreshes itself (an extract waiting in the queue) is asked for again, as a browser would
+    Returns the parsed page, or None if the request failed
+    '''
+    data = None
+    if form is not None:
+        data = urllib.parse.urlencode(form, doseq=True).encode('utf-8')
+    start = time.perf_counter()
+    while True:
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=300) as response:
+                body = response.read()
+        except urllib.error.HTTPError as thisE:
+            timings[step].append(time.perf_counter() - start)
+            errors[step][f'HTTP {thisE.code}'] += 1
+            return None
+        except Exception as thisE:
+            timings[step].append(time.perf_counter() - start)
+            errors[step][type(thisE).__name__] += 1
+            return None
+        page = FormParser()
+        if not response.headers.get_content_type().startswith('application/'):
+            page.feed(body.decode('utf-8', errors='replace'))
+        if not page.refresh:
+            break
+        time.sleep(1)
+    timings[step].append(time.perf_counter() - start)
+    return page
+
+
+def runSession(sessionNo, baseURL, timings, errors):
+    '''
+    Replay one data mining session - pick a table, some columns, constrain a number column, maybe sum it, then mine the extract
+    Returns True if every step succeeded
+    '''
+    rng = random.Random(sessionNo)
+    thisTable = rng.choice(list(d.config.mineTables))
+    columns = d.config.mineTables[thisTable]['columns']
+    numberColumns = [i for i, thisCol in enumerate(columns) if thisCol['datatype'] in ['int', 'float', 'numeric', 'decimal']]
+    lookupColumns = [i for i, thisCol in enumerate(columns) if thisCol['lookupTable'] is not None]
+    if len(numberColumns) == 0:
+        errors['splash'][f'Table {thisTable} has no number columns to constrain'] += 1
+        return False
+    constrained = rng.choice(numberColumns)
+    selected = {constrained}
+    if len(lookupColumns) > 0:
+        selected.add(rng.choice(lookupColumns))
+    selected.update(rng.sample(range(len(columns)), min(2, len(columns))))
+    selected = sorted(selected)
+
+    if doStep('splash', f'{baseURL}/', None, timings, errors) is None:
+        return False
+    if doStep('doSelectColumns', f'{baseURL}/doSelectColumns', {'table':thisTable}, timings, errors) is None:
+        return False
+    page = doStep('constrainColumns', f'{baseURL}/constrainColumns', {'table':thisTable, 'selected':selected}, timings, errors)
+    if page is None:
+        return False
+    page = doStep('doNextConstraint', f'{baseURL}/doNextConstraint', {**page.hidden, 'selected':[selected.index(constrained)]}, timings, errors)
+    if page is None:
+        return False
+    page = doStep('doThisConstraint', f'{baseURL}/doThisConstraint', {**page.hidden, 'constraint':['gteThan']}, timings, errors)
+    if page is None:
+        return False
+    page = doStep('setConstraints', f'{baseURL}/setConstraints', {**page.hidden, 'inputGteThan':rng.randint(0, 999)}, timings, errors)
+    if page is None:
+        return False
+    form = dict(page.hidden)
+    if rng.random() < 0.5:
+        form['selectSum'] = [constrained]
+    page = doStep('doAggregates', f'{baseURL}/doAggregates', form, timings, errors)
+    if page is None:
+        return False
+    extractLinks = [link for link in page.links if link.startswith('/doSQL/')]
+    if len(extractLinks) == 0:
+        errors['doAggregates']['No extract link'] += 1
+        return False
+    return doStep('doSQL', f'{baseURL}{extractLinks[0]}', None, timings, errors) is not None
+
+
+def report(timings, errors, sessions, succeeded, elapsed):
+    '''
+    Print the throughput, and the latency percentiles and errors for each step
+    '''
+    requests = sum(len(timings[step]) for step in STEPS)
+    print(f'{"Step":20} {"Requests":>9} {"Errors":>7} {"Error%":>7} {"p50 ms":>9} {"p90 ms":>9} {"p99 ms":>9} {"max ms":>9}')
+    for step in STEPS:
+        thisTimings = [seconds * 1000 for seconds in timings[step]]
+        stepErrors = sum(errors[step].values())
+        if len(thisTimings) == 0:
+            print(f'{step:20} {0:>9} {stepErrors:>7}')
+            continue
+        if len(thisTimings) > 1:
+            percentiles = statistics.quantiles(thisTimings, n=100, method='inclusive')
+            p50, p90, p99 = percentiles[49], percentiles[89], percentiles[98]
+        else:
+            p50 = p90 = p99 = thisTimings[0]
+        print(f'{step:20} {len(thisTimings):>9} {stepErrors:>7} {100 * stepErrors / len(thisTimings):>7.1f} {p50:>9.1f} {p90:>9.1f} {p99:>9.1f} {max(thisTimings):>9.1f}')
+    for step in STEPS:
+        for error, count in errors[step].items():
+            print(f'{step}: {count} x {error}')
+    print(f'{sessions} sessions ({succeeded} succeeded) and {requests} requests in {elapsed:.2f} seconds')
+    print(f'Throughput: {sessions / elapsed:.2f} sessions/second, {requests / elapsed:.2f} requests/second')
+
+
+if __name__ == '__main__':
+
+    '''
+    The main code
+    Start by parsing the command line arguements and setting up logging.
+    Then build the test database, load the configuration workbook and start the web site.
+    Then replay the data mining sessions and report the results.
+    '''
+
+    # Save the program name
+    progName = sys.argv[0]
+    progName = progName[0:-3]        # Strip off the .py ending
+
+    # set the options
+    parser = argparse.ArgumentParser(description='Simple Data Miner load test')
+    parser.add_argument('-I', '--inputDir', dest='inputDir', default='.',
+                        help='The directory containing the Excel workbook containing the configuration of the mineable tables.')
+    parser.add_argument('-i', '--inputWorkbook', dest='inputWorkbook', default='tablesConfig.xlsx',
+                        help='The name of the Excel workbook containing configuration of the mineable tables')
+    parser.add_argument('-t', '--testDatabase', dest='testDatabase', help='The SQLite database file to build (default - a temporary file)')
+    parser.add_argument('-r', '--rows', dest='rows', type=int, default=10000, help='The number of rows in each minable table in the test database (default=10000)')
+    parser.add_argument('-c', '--concurrency', dest='concurrency', type=int, default=10, help='The number of users mining data at the one time (default=10)')
+    parser.add_argument('-n', '--sessions', dest='sessions', type=int, default=100, help='The total number of data mining sessions to replay (default=100)')
+    parser.add_argument('-X', '--maxExtracts', dest='maxExtracts', type=int, default=0, help='The maximum number of extracts that can run at the one time (default=0 - no limit)')
+    parser.add_argument ('-v', '--verbose', dest='verbose', type=int, choices=range(0,5), help='The level of logging\n\t0=CRITICAL,1=ERROR,2=WARNING,3=INFO,4=DEBUG')
+    args = parser.parse_args()
+
+    # Parse the command line options
+    inputDir = args.inputDir
+    inputWorkbook = args.inputWorkbook
+    testDatabase = args.testDatabase
+    rows = args.rows
+    concurrency = args.concurrency
+    sessions = args.sessions
+    maxExtracts = args.maxExtracts
+    loggingLevel = args.verbose
+
+    # Set up logging
+    logging_levels = {0:logging.CRITICAL, 1:logging.ERROR, 2:logging.WARNING, 3:logging.INFO, 4:logging.DEBUG}
+    logfmt = progName + ' [%(asctime)s]: %(message)s'
+    if loggingLevel is not None:
+        logging.basicConfig(format=logfmt, datefmt='%d/%m/%y %H:%M:%S %p', level=logging_levels[loggingLevel])
+    else:
+        logging.basicConfig(format=logfmt, datefmt='%d/%m/%y %H:%M:%S %p')
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    # Build the test database
+    if testDatabase is None:
+        testDatabase = os.path.join(tempfile.mkdtemp(), 'SimpleDataMinerLoadTest.db')
+    workbookFile = os.path.join(inputDir, inputWorkbook)
+    d.engine = create_engine(f'sqlite:///{testDatabase}', echo=False)
+    logging.info('Building test database %s', testDatabase)
+    buildTestDatabase(d.engine, workbookFile, rows)
+
+    # Load the configuration workbook, exactly as the Simple Data Miner does
+    metadata = MetaData()
+    metadata.reflect(bind=d.engine, views=True)
+    mineTables, tableSignatures, errorMessage = sdm.loadTablesConfig(workbookFile, metadata, None)
+    if errorMessage is not None:
+        logging.critical(errorMessage)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+    d.config = ConfigSnapshot(metadata, mineTables, tableSignatures)
+    for thisTable, mineTable in mineTables.items():
+        d.columnStats[thisTable] = sdm.tableStatistics(thisTable, mineTable)
+    d.extractLimiter = ExtractLimiter(maxExtracts, 0, sessions, 300)
+
+    # Start the web site and replay the sessions
+    server, baseURL = startServer()
+    timings = {step:[] for step in STEPS}
+    errors = {step:collections.Counter() for step in STEPS}
+    loadStart = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda sessionNo: runSession(sessionNo, baseURL, timings, errors), range(sessions)))
+    loadElapsed = time.perf_counter() - loadStart
+    server.shutdown()
+
+    report(timings, errors, sessions, sum(1 for result in results if result), loadElapsed)
+    logging.shutdown()
+    if all(results):
+        sys.exit(d.EX_OK)
+    sys.exit(d.EX_WARN)
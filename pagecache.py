@@ -0,0 +1,72 @@
+'''
+Precomputed pages for the Simple Data Miner.
+
+Pages, and parts of pages, that only depend upon the configuration of the minable tables
+are built once for each version of the configuration, rather than on every request.
+Each page is kept both as is and gzip compressed, along with an ETag and a Last-Modified time,
+so that browsers that already have the page can be answered with "304 Not Modified".
+A new PageCache is created whenever a new configuration is loaded, which discards everything built from the old one.
+'''
+
+# pylint: disable=invalid-name, line-too-long
+
+import gzip
+import hashlib
+import threading
+import datetime
+
+
+class CachedPage:
+    '''
+    One precomputed page
+    '''
+
+    def __init__(self, page, lastModified):
+        self.body = page.encode('utf-8')
+        self.gzipBody = gzip.compress(self.body)
+        self.etag = hashlib.sha1(self.body).hexdigest()[:20]
+        self.lastModified = lastModified
+
+
+class PageCache:
+    '''
+    The pages, and parts of pages, built from one version of the configuration
+    '''
+
+    def __init__(self):
+        self.lastModified = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        self.lock = threading.Lock()
+        self.pages = {}
+        self.fragments = {}
+
+    def page(self, key, build):
+        '''
+        Return the precomputed page for this key, building it (by calling build) the first time it is asked for
+        '''
+        with self.lock:
+            thisPage = self.pages.get(key)
+        if thisPage is None:
+            thisPage = CachedPage(build(), self.lastModified)
+            with self.lock:
+                thisPage = self.pages.setdefault(key, thisPage)
+        return thisPage
+
+    def fragment(self, key, version=None):
+        '''
+        Return the precomputed part of a page for this key, or None if it hasn't been built yet
+        Parts of pages built from data that is read again from time to time (such as lookup codes) carry a version,
+        and only a part built from the same version is returned
+        '''
+        with self.lock:
+            thisFragment = self.fragments.get(key)
+        if (thisFragment is None) or (thisFragment[0] != version):
+            return None
+        return thisFragment[1]
+
+    def setFragment(self, key, fragment, version=None):
+        '''
+        Save a precomputed part of a page, built from this version of its data
+        '''
+        with self.lock:
+            self.fragments[key] = (version, fragment)
+        return fragment
@@ -0,0 +1,62 @@
+'''
+On demand request profiling for the Simple Data Miner.
+
+A sampling profiler that, while running, regularly records the stack of every thread in the process.
+Sampling every thread, rather than just the request's thread, means that time spent in the worker threads
+running the SQL queries, pandas and openpyxl is included in the profile.
+The profile is written in the "collapsed stacks" format (one line per distinct stack, with a sample count),
+which can be loaded into flame graph tools such as speedscope or flamegraph.pl.
+'''
+
+# pylint: disable=invalid-name, line-too-long
+
+import sys
+import os
+import threading
+import collections
+
+
+class StackSampler:
+    '''
+    Sample the stacks of every thread (other than the sampler itself) at regular intervals
+    '''
+
+    def __init__(self, interval):
+        self.interval = interval                    # Seconds between samples
+        self.stacks = collections.Counter()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.sample, name='StackSampler', daemon=True)
+
+    def start(self):
+        '''
+        Start sampling
+        '''
+        self.thread.start()
+
+    def sample(self):
+        '''
+        Record the stack of every thread until told to stop
+        '''
+        me = threading.get_ident()
+        while not self.stopping.wait(self.interval):
+            threadNames = {thread.ident:thread.name for thread in threading.enumerate()}
+            for threadId, frame in sys._current_frames().items():     # pylint: disable=protected-access
+                if threadId == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(threadNames.get(threadId, str(threadId)))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self, profileFile):
+        '''
+        Stop sampling and write the collapsed stacks to the profile file
+        '''
+        self.stopping.set()
+        self.thread.join()
+        with open(profileFile, 'wt', encoding='utf-8', newline='') as profileTarget:
+            for stack, count in self.stacks.most_common():
+                profileTarget.write(f'{stack} {count}\n')
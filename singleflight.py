@@ -0,0 +1,54 @@
+'''
+Single-flight execution of the Simple Data Miner queries.
+
+When the same query is requested while an identical query is already running,
+the later requests wait for, and share, the result of the running query
+rather than running the query again.
+'''
+
+# pylint: disable=invalid-name, line-too-long
+
+import threading
+
+
+class Flight:
+    '''
+    One running query, and the result that will be shared with everyone waiting on it
+    '''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    '''
+    The queries that are currently running, keyed by their normalized SQL statement
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inFlight = {}
+
+    def join(self, key):
+        '''
+        Join the running query for this key, or start a new one
+        Returns the flight and True if the caller must run the query, False if the caller must wait for the result
+        '''
+        with self.lock:
+            if key in self.inFlight:
+                return self.inFlight[key], False
+            flight = Flight()
+            self.inFlight[key] = flight
+            return flight, True
+
+    def finish(self, key, flight, result, error):
+        '''
+        Record the result (or error) of the query and release everyone waiting on it
+        '''
+        flight.result = result
+        flight.error = error
+        with self.lock:
+            del self.inFlight[key]
+        flight.done.set()
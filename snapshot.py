@@ -0,0 +1,27 @@
+'''
+The configuration snapshot for the Simple Data Miner.
+
+Everything that is built from one version of the configuration workbook - the tables that can be mined,
+the database metadata they were checked against, and the pages, lookup codes and view names cached for them -
+is kept together in one ConfigSnapshot. A reloaded configuration is swapped in by replacing the whole snapshot
+with a single assignment, and each request reads the snapshot once, so no request can see part of one configuration
+and part of another.
+'''
+
+# pylint: disable=invalid-name, line-too-long, too-few-public-methods
+
+from pagecache import PageCache
+
+
+class ConfigSnapshot:
+    '''
+    One version of the configuration, and everything built from it
+    '''
+
+    def __init__(self, metadata, mineTables, tableSignatures):
+        self.metadata = metadata                    # The database metadata
+        self.mineTables = mineTables                # A dictionary of all the tables that can be mined
+        self.tableSignatures = tableSignatures      # The configuration signature of each table that can be mined
+        self.pageCache = PageCache()                # The pages, and parts of pages, precomputed from this configuration
+        self.lookupCodes = {}                       # A cache of (read time, code/description dictionary) for each lookup table
+        self.viewNames = None                       # The names (lower case) of the views in the database, which can't be sampled with TABLESAMPLE
@@ -0,0 +1,10 @@
+'''
+Make the Simple Data Miner modules, which live at the top of the repository, importable by the tests
+'''
+
+# pylint: disable=invalid-name
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
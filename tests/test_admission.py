@@ -0,0 +1,66 @@
+'''
+Tests for the admission control of extracts
+'''
+
+# pylint: disable=invalid-name, line-too-long, missing-function-docstring
+
+import threading
+import time
+from admission import ExtractLimiter
+
+
+def acquireInThread(limiter, table, user, key=None):
+    '''
+    Start acquiring in another thread, returning the thread and where its result and wait time will be put
+    '''
+    outcome = {}
+
+    def acquire():
+        start = time.monotonic()
+        outcome['result'] = limiter.acquire(table, user, None, key)
+        outcome['waited'] = time.monotonic() - start
+    thread = threading.Thread(target=acquire, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def test_limits_and_queue_length():
+    limiter = ExtractLimiter(1, 0, 0, 1)
+    assert limiter.acquire('t', 'a', None) == (None, None)
+    rejected, position = limiter.acquire('t', 'b', None)
+    assert rejected.startswith('The database is busy') and position is None
+    limiter.release('t', 'a')
+    assert limiter.acquire('t', 'b', None) == (None, None)
+
+
+def test_queued_extract_is_told_its_place_and_keeps_it():
+    limiter = ExtractLimiter(1, 0, 5, 10, pollWait=0.1, keepPlace=5)
+    assert limiter.acquire('t', 'a', None) == (None, None)
+    assert limiter.acquire('t', 'b', None, 'bKey') == (None, 1)
+    assert limiter.acquire('t', 'b', None, 'bKey') == (None, 1)
+    assert len(limiter.waiting) == 1
+    limiter.release('t', 'a')
+    assert limiter.acquire('t', 'b', None, 'bKey') == (None, None)
+    assert (limiter.waiting, limiter.places) == ([], {})
+
+
+def test_away_place_does_not_hold_a_free_slot():
+    limiter = ExtractLimiter(1, 0, 20, 20, pollWait=0.2, keepPlace=5)
+    assert limiter.acquire('t', 'holder', None) == (None, None)
+    assert limiter.acquire('t', 'away', None, 'awayKey') == (None, 1)      # Its browser never comes back
+    thread, outcome = acquireInThread(limiter, 't', 'live')
+    time.sleep(0.3)
+    released = time.monotonic()
+    limiter.release('t', 'holder')
+    thread.join(2)
+    assert outcome['result'] == (None, None)
+    assert time.monotonic() - released < 1.0
+
+
+def test_abandoned_place_is_given_up():
+    limiter = ExtractLimiter(1, 0, 20, 20, pollWait=0.1, keepPlace=0.2)
+    assert limiter.acquire('t', 'holder', None) == (None, None)
+    assert limiter.acquire('t', 'away', None, 'awayKey') == (None, 1)
+    time.sleep(0.3)
+    assert limiter.acquire('t', 'other', None, 'otherKey') == (None, 1)
+    assert 'awayKey' not in limiter.places
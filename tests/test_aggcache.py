@@ -0,0 +1,86 @@
+'''
+Tests for the parsing and re-summing of materialized aggregates
+'''
+
+# pylint: disable=invalid-name, line-too-long, missing-function-docstring
+
+import decimal
+import pandas as pd
+import pytest
+from aggcache import AggregateQuery, AggregateCache, splitClauses, listConstraint
+
+
+DATATYPES = {'hospital_code':'string', 'event_seq':'int', 'cost':'numeric', 'event_date':'date'}
+
+
+def test_splitClauses_top_level_only():
+    assert splitClauses('a = 1 AND (b = 2 AND c = 3) AND d like "x AND y"') == ['a = 1', '(b = 2 AND c = 3)', 'd like "x AND y"']
+
+
+def test_splitClauses_empty():
+    assert splitClauses('') == []
+    assert splitClauses(None) == []
+
+
+def test_listConstraint_equals():
+    assert listConstraint('event_seq = 7') == ('event_seq', {7})
+    assert listConstraint('hospital_code = "HO1"') == ('hospital_code', {'HO1'})
+
+
+def test_listConstraint_in_lists_ored_together():
+    assert listConstraint('(event_seq in (1, 2) OR event_seq in (3))') == ('event_seq', {1, 2, 3})
+    assert listConstraint('event_seq IN (1, 2)') == ('event_seq', {1, 2})
+
+
+def test_listConstraint_keeps_large_integers_exact():
+    assert listConstraint('event_seq in (12345678901234567, 2.5)') == ('event_seq', {12345678901234567, 2.5})
+
+
+def test_listConstraint_not_a_list():
+    assert listConstraint('event_seq > 7') is None
+    assert listConstraint('(event_seq in (1) OR cost in (2))') is None
+    assert listConstraint('event_seq not in (1)') is None
+
+
+def test_only_whole_number_lists_are_materialized():
+    query = AggregateQuery('t', 'hospital_code, sum(cost)', 'hospital_code in ("HO1", "HO2") AND event_seq in (1, 2) AND cost in (0.10)', 'hospital_code', DATATYPES)
+    assert query.inLists == {'event_seq':{1, 2}}
+    assert query.residual == 'cost in (0.10) AND hospital_code in ("HO1", "HO2")'
+    assert query.grain == ['hospital_code', 'event_seq']
+
+
+def test_fractional_values_stay_in_the_residual():
+    query = AggregateQuery('t', 'hospital_code, sum(cost)', 'event_seq in (1, 2.5)', 'hospital_code', DATATYPES)
+    assert query.inLists == {}
+    assert query.residual == 'event_seq in (1, 2.5)'
+
+
+def test_cannot_materialize_other_aggregates():
+    with pytest.raises(ValueError):
+        AggregateQuery('t', 'hospital_code, avg(cost)', '', 'hospital_code', DATATYPES)
+
+
+@pytest.mark.parametrize('seq', [pd.Series([1, 2, 3], dtype='int64'), pd.Series([1.0, 2.0, 3.0]), pd.Series([decimal.Decimal(1), decimal.Decimal(2), decimal.Decimal(3)], dtype=object)])
+def test_resum_matches_the_database_types(seq):
+    partial_df = pd.DataFrame({'hospital_code':['HO1', 'HO1', 'HO2'], 'event_seq':seq, 'sum(cost)':[1.0, 2.0, 4.0]})
+    query = AggregateQuery('t', 'hospital_code, sum(cost)', 'event_seq in (1, 3)', 'hospital_code', DATATYPES)
+    extract_df = query.resum(partial_df)
+    assert extract_df.to_dict('list') == {'hospital_code':['HO1', 'HO2'], 'sum(cost)':[1.0, 4.0]}
+
+
+def test_regroup_keeps_every_row():
+    partial_df = pd.DataFrame({'hospital_code':['HO1', 'HO1', None], 'event_seq':[1, 2, 1], 'count(cost)':[1, 2, 4], 'sum(cost)':[None, 2.0, 4.0]})
+    query = AggregateQuery('t', 'hospital_code, count(cost), sum(cost)', 'event_seq in (1, 2)', 'hospital_code', DATATYPES)
+    extract_df = query.regroup(partial_df)
+    assert extract_df['count(cost)'].tolist() == [3, 4]
+    assert extract_df['sum(cost)'].tolist() == [2.0, 4.0]
+    assert extract_df['hospital_code'].isna().tolist() == [False, True]
+
+
+def test_cache_answers_subsets():
+    cache = AggregateCache(60, 10, 1000)
+    wider = AggregateQuery('t', 'hospital_code, sum(cost)', 'event_seq in (1, 2, 3) AND cost > 5', 'hospital_code', DATATYPES)
+    cache.add(wider, pd.DataFrame())
+    assert cache.find(AggregateQuery('t', 'hospital_code, sum(cost)', 'cost > 5 AND event_seq = 2', 'hospital_code', DATATYPES)) is not None
+    assert cache.find(AggregateQuery('t', 'hospital_code, sum(cost)', 'event_seq in (1, 4) AND cost > 5', 'hospital_code', DATATYPES)) is None
+    assert cache.find(AggregateQuery('t', 'hospital_code, sum(cost)', 'event_seq in (1, 2) AND cost > 6', 'hospital_code', DATATYPES)) is None
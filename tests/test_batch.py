@@ -0,0 +1,57 @@
+'''
+Tests for the batch extract runner
+'''
+
+# pylint: disable=invalid-name, line-too-long, missing-function-docstring, redefined-outer-name
+
+import os
+import pytest
+from sqlalchemy import MetaData, create_engine
+import data as d
+import SimpleDataMiner as sdm
+import loadTest
+from snapshot import ConfigSnapshot
+
+
+WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tablesConfig.xlsx')
+
+
+@pytest.fixture
+def testDatabase(tmp_path, monkeypatch):
+    '''
+    A small SQLite database, shaped by the configuration workbook, with the workbook's configuration loaded
+    '''
+    engine = create_engine(f'sqlite:///{tmp_path / "batch.db"}')
+    loadTest.buildTestDatabase(engine, WORKBOOK, 200)
+    metadata = MetaData()
+    metadata.reflect(bind=engine, views=True)
+    mineTables, tableSignatures, errorMessage = sdm.loadTablesConfig(WORKBOOK, metadata, None)
+    assert errorMessage is None
+    monkeypatch.setattr(d, 'engine', engine)
+    monkeypatch.setattr(d, 'config', ConfigSnapshot(metadata, mineTables, tableSignatures))
+    return tmp_path
+
+
+def test_batch(testDatabase):
+    specs = [{'name':'costs', 'table':'inpatdrgcosts', 'columns':['hospital_code', 'cost'], 'constraints':[{'column':'cost', 'constraint':'gteThan', 'value':500}], 'format':'csv'},
+             {'name':'totals', 'table':'inpatdrgcosts', 'columns':['hospital_code', 'cost'], 'sum':['cost'], 'decode':True},
+             {'name':'unknown', 'table':'nosuchtable', 'columns':['cost']}]
+    summary = sdm.runBatch(specs, str(testDatabase), 2)
+    assert [(name, status) for name, status, rows, seconds in summary] == [('costs', 'OK'), ('totals', 'OK'), ('unknown', 'Unknown table "nosuchtable"')]
+    assert os.path.exists(testDatabase / 'costs.csv')
+    assert os.path.exists(testDatabase / 'totals.xlsx')
+
+
+def test_malformed_specs_fail_on_their_own(testDatabase):
+    specs = [{'name':'columnsString', 'table':'inpatdrgcosts', 'columns':'hospital_code'},
+             {'name':'orderByString', 'table':'inpatdrgcosts', 'columns':['hospital_code'], 'orderBy':'hospital_code'},
+             {'name':'badConstraint', 'table':'inpatdrgcosts', 'columns':['hospital_code'], 'constraints':['cost > 5']},
+             'not a spec',
+             {'name':'good', 'table':'inpatdrgcosts', 'columns':['hospital_code']}]
+    summary = sdm.runBatch(specs, str(testDatabase), 2)
+    statuses = {name:status for name, status, rows, seconds in summary}
+    assert statuses['columnsString'] == '"columns" must be a list'
+    assert statuses['orderByString'] == '"orderBy" must be a dictionary'
+    assert statuses['badConstraint'].startswith('Failed: ')
+    assert statuses['extract3'] == 'The query spec is not a dictionary'
+    assert statuses['good'] == 'OK'
@@ -0,0 +1,69 @@
+'''
+Tests for the column statistics and the estimates made from them
+'''
+
+# pylint: disable=invalid-name, line-too-long, missing-function-docstring
+
+import pytest
+from columnstats import ColumnStats, WhereEstimator
+
+
+def tableStats():
+    # 1000 rows - code is HO1 to HO4 equally often, cost is 0 to 999, and note is empty in half the rows
+    return {'code':ColumnStats(1000, 0, 'HO1', 'HO4', [f'HO{1 + i % 4}' for i in range(1000)], 20),
+            'cost':ColumnStats(1000, 0, 0.0, 999.0, [float(i) for i in range(1000)], 20),
+            'note':ColumnStats(1000, 500, 'a', 'b', ['a'] * 250 + ['b'] * 250, 20)}
+
+
+def test_equals_and_in():
+    assert WhereEstimator('code = "HO1"', tableStats()).estimate() == pytest.approx(0.25)
+    assert WhereEstimator('code in ("HO1", "HO2", "HO1")', tableStats()).estimate() == pytest.approx(0.5)
+    assert WhereEstimator('code = "HO9"', tableStats()).estimate() == 0.0
+
+
+def test_ranges():
+    assert WhereEstimator('cost < 500', tableStats()).estimate() == pytest.approx(0.5, abs=0.01)
+    assert WhereEstimator('cost > 750', tableStats()).estimate() == pytest.approx(0.25, abs=0.01)
+
+
+def test_and_or_are_independent():
+    assert WhereEstimator('code = "HO1" AND cost < 500', tableStats()).estimate() == pytest.approx(0.125, abs=0.01)
+    assert WhereEstimator('(code = "HO1") OR (code = "HO2")', tableStats()).estimate() == pytest.approx(1 - 0.75 * 0.75)
+
+
+def test_nulls_and_like():
+    assert WhereEstimator('note != "a"', tableStats()).estimate() == pytest.approx(0.25)
+    assert WhereEstimator('code like "ho%"', tableStats()).estimate() == pytest.approx(1.0)
+    assert WhereEstimator('code not like "%1"', tableStats()).estimate() == pytest.approx(0.75)
+
+
+@pytest.mark.parametrize('where', ['other = 1', 'cost < "x"', 'cost <', 'cost = 1 cost = 2', 'cost ~ 1'])
+def test_cannot_estimate(where):
+    with pytest.raises(ValueError):
+        WhereEstimator(where, tableStats()).estimate()
+
+
+def tableRows():
+    # The rows that tableStats() describes
+    return [{'code':f'HO{1 + i % 4}', 'cost':float(i), 'note':None if i % 2 else ('a' if i % 4 == 0 else 'b')} for i in range(1000)]
+
+
+@pytest.mark.parametrize('where, matches', [
+    ('code = "HO1" AND cost < 500', lambda row: row['code'] == 'HO1' and row['cost'] < 500),
+    ('cost < 100 AND cost > 900', lambda row: False),
+    ('cost >= 100 AND cost < 200 AND code != "HO2"', lambda row: 100 <= row['cost'] < 200 and row['code'] != 'HO2'),
+    ('(code = "HO1") OR (code = "HO2")', lambda row: row['code'] in ['HO1', 'HO2']),
+    ('(cost < 600) OR (cost > 400)', lambda row: True),
+    ('(code = "HO1" AND note = "a") OR (cost > 900)', lambda row: (row['code'] == 'HO1' and row['note'] == 'a') or row['cost'] > 900)])
+def test_bounds_hold_for_correlated_constraints(where, matches):
+    fraction = sum(1 for row in tableRows() if matches(row)) / 1000
+    lower, upper = WhereEstimator(where, tableStats()).bounds()
+    assert lower <= fraction <= upper
+
+
+def test_bounds():
+    assert WhereEstimator('code = "HO1" AND cost < 500', tableStats()).bounds() == pytest.approx((0.0, 0.25))
+    assert WhereEstimator('(code = "HO1") OR (code = "HO2")', tableStats()).bounds() == pytest.approx((0.25, 0.5))
+    assert WhereEstimator('code like "ho%" OR cost < 500', tableStats()).bounds() == pytest.approx((1.0, 1.0))
+    lower, upper = WhereEstimator('cost < 500', tableStats()).bounds()
+    assert lower < 0.5 < upper
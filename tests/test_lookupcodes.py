@@ -0,0 +1,63 @@
+'''
+Tests for the kept lookup codes, and the parts of pages built from them
+'''
+
+# pylint: disable=invalid-name, line-too-long, missing-function-docstring, redefined-outer-name
+
+import pytest
+from sqlalchemy import create_engine, text
+import data as d
+import SimpleDataMiner as sdm
+from pagecache import PageCache
+from snapshot import ConfigSnapshot
+
+
+HOSPITAL = {'lookupTable':'hospitals', 'lookupCodeColumn':'code', 'lookupDescriptionColumn':'name'}
+
+
+@pytest.fixture
+def hospitals(tmp_path, monkeypatch):
+    '''
+    A SQLite lookup table of hospital codes
+    '''
+    engine = create_engine(f'sqlite:///{tmp_path / "lookup.db"}')
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE hospitals (code varchar(10), name varchar(40))'))
+        conn.execute(text("INSERT INTO hospitals VALUES ('HO1', 'First hospital')"))
+    monkeypatch.setattr(d, 'engine', engine)
+    monkeypatch.setattr(d, 'config', ConfigSnapshot(None, {}, {}))
+    return engine
+
+
+def addHospital(engine):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO hospitals VALUES ('HO2', 'Second hospital')"))
+
+
+def test_codes_are_kept(hospitals, monkeypatch):
+    monkeypatch.setattr(d, 'lookupAge', 3600)
+    assert sdm.getLookupCodes(HOSPITAL) == {'HO1':'First hospital'}
+    addHospital(hospitals)
+    assert sdm.getLookupCodes(HOSPITAL) == {'HO1':'First hospital'}
+
+
+def test_old_codes_are_read_again(hospitals, monkeypatch):
+    monkeypatch.setattr(d, 'lookupAge', 3600)
+    firstRead, codes = sdm.readLookupCodes(HOSPITAL)
+    assert codes == {'HO1':'First hospital'}
+    addHospital(hospitals)
+    monkeypatch.setattr(d, 'lookupAge', 0)
+    secondRead, codes = sdm.readLookupCodes(HOSPITAL)
+    assert codes == {'HO1':'First hospital', 'HO2':'Second hospital'}
+    assert secondRead > firstRead
+
+
+def test_fragment_versions():
+    pageCache = PageCache()
+    assert pageCache.fragment('options') is None
+    assert pageCache.setFragment('options', 'built', 1) == 'built'
+    assert pageCache.fragment('options', 1) == 'built'
+    assert pageCache.fragment('options', 2) is None
+    assert pageCache.fragment('options') is None
+    pageCache.setFragment('inputs', 'fixed')
+    assert pageCache.fragment('inputs') == 'fixed'
@@ -0,0 +1,47 @@
+'''
+Tests for randomly sampling mined extracts
+'''
+
+# pylint: disable=invalid-name, line-too-long, missing-function-docstring, redefined-outer-name
+
+import pytest
+from sqlalchemy import create_engine, text
+import data as d
+import SimpleDataMiner as sdm
+
+
+@pytest.fixture
+def numbers(tmp_path, monkeypatch):
+    '''
+    A SQLite table of the numbers 0 to 999, in order
+    '''
+    engine = create_engine(f'sqlite:///{tmp_path / "sample.db"}')
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE numbers (n int)'))
+        conn.execute(text('INSERT INTO numbers VALUES (:n)'), [{'n':n} for n in range(1000)])
+    monkeypatch.setattr(d, 'engine', engine)
+    return engine
+
+
+def sample(sampleRows, orderBy='', topN=None):
+    tableSample, where = sdm.sampleParts('numbers', sampleRows, 1000)
+    return list(sdm.runSQL(sdm.extractSQL('numbers', 'n', where, '', orderBy, topN, False, tableSample, sampleRows))['n'])
+
+
+def test_sample_covers_the_table(numbers):
+    sampled = sample(100)
+    assert len(sampled) == 100
+    assert len(set(sampled)) == 100
+    assert max(sampled) > 700          # Not just the first rows scanned of the over sized sample
+
+
+def test_ordered_sample(numbers):
+    sampled = sample(100, 'n DESC', 10)
+    assert len(sampled) == 10
+    assert sampled == sorted(sampled, reverse=True)
+
+
+def test_most_of_the_rows(numbers):
+    sampled = sample(900)
+    assert len(sampled) == 900
+    assert len(set(sampled)) == 900
@@ -0,0 +1,76 @@
+'''
+Tests for sharing one execution between identical concurrent queries
+'''
+
+# pylint: disable=invalid-name, line-too-long, missing-function-docstring
+
+import threading
+import pytest
+import SimpleDataMiner as sdm
+from singleflight import SingleFlight
+
+
+class WatchedFlights(SingleFlight):
+    '''
+    A SingleFlight that signals when a query has joined an identical running query
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.followerJoined = threading.Event()
+
+    def join(self, key):
+        flight, isLeader = super().join(key)
+        if not isLeader:
+            self.followerJoined.set()
+        return flight, isLeader
+
+
+def leaderAndFollower(monkeypatch, leaderFails):
+    '''
+    Run a query, and an identical query that joins it, where the first query fails with leaderFails
+    Returns what the leader raised and what the follower returned or raised
+    '''
+    flights = WatchedFlights()
+    monkeypatch.setattr(sdm, 'queryFlights', flights)
+    leaderStarted = threading.Event()
+
+    def runSQL(selectText):
+        if not leaderStarted.is_set():
+            leaderStarted.set()
+            assert flights.followerJoined.wait(5)
+            raise leaderFails
+        return selectText
+    monkeypatch.setattr(sdm, 'runSQL', runSQL)
+
+    outcomes = {}
+
+    def run(who):
+        try:
+            outcomes[who] = sdm.readSQL('SELECT 1')
+        except BaseException as thisE:      # pylint: disable=broad-exception-caught
+            outcomes[who] = thisE
+
+    leader = threading.Thread(target=run, args=('leader',), daemon=True)
+    leader.start()
+    assert leaderStarted.wait(5)
+    follower = threading.Thread(target=run, args=('follower',), daemon=True)
+    follower.start()
+    leader.join(5)
+    follower.join(5)
+    assert not follower.is_alive(), 'The follower is still waiting for the abandoned query'
+    return outcomes
+
+
+def test_follower_shares_the_error(monkeypatch):
+    outcomes = leaderAndFollower(monkeypatch, ValueError('bad SQL'))
+    assert isinstance(outcomes['leader'], ValueError)
+    assert outcomes['follower'] is outcomes['leader']
+
+
+@pytest.mark.parametrize('interrupt', [KeyboardInterrupt(), SystemExit(1)])
+def test_follower_is_released_when_the_leader_is_interrupted(monkeypatch, interrupt):
+    outcomes = leaderAndFollower(monkeypatch, interrupt)
+    assert outcomes['leader'] is interrupt
+    assert isinstance(outcomes['follower'], RuntimeError)
+    assert sdm.readSQL('SELECT 1') == 'SELECT 1'        # The abandoned query is no longer in flight
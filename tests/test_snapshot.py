@@ -0,0 +1,30 @@
+'''
+Tests for the configuration snapshot that each request reads
+'''
+
+# pylint: disable=invalid-name, line-too-long, missing-function-docstring
+
+import data as d
+import SimpleDataMiner as sdm
+from snapshot import ConfigSnapshot
+
+
+def test_request_keeps_its_snapshot(monkeypatch):
+    oldConfig = ConfigSnapshot(None, {'old':{}}, {})
+    newConfig = ConfigSnapshot(None, {'new':{}}, {})
+    monkeypatch.setattr(d, 'config', oldConfig)
+    with sdm.app.test_request_context('/'):
+        assert sdm.currentConfig() is oldConfig
+        d.config = newConfig                        # Reloaded part way through the request
+        assert sdm.currentConfig() is oldConfig
+        assert sdm.currentConfig().pageCache is oldConfig.pageCache
+    with sdm.app.test_request_context('/'):
+        assert sdm.currentConfig() is newConfig
+    assert sdm.currentConfig() is newConfig         # Outside of a request
+
+
+def test_snapshot_starts_empty():
+    config = ConfigSnapshot(None, {}, {})
+    assert config.lookupCodes == {}
+    assert config.viewNames is None
+    assert config.pageCache.fragment('anything') is None